@@ -0,0 +1,333 @@
+import random
+
+import numpy
+
+from blocks import Blocks
+from engine import Engine
+
+
+class Batch:
+    def __init__(self, seeds, grid=(10, 20), start=(4, 0), gravity=20, soft_gravity=2):
+        """
+        Runs one game per seed in lockstep, with all boards in a single numpy array.
+        Follows the same rules as Engine, so a board ends up exactly like an
+        Engine on Blocks(grid, grid, start, seed) given the same actions.
+        :param seeds: one seed per board
+        :param grid: (columns, rows) of every board
+        :param start: position new shapes appear at
+        :param gravity: steps between the shapes falling one row
+        :param soft_gravity: steps between falling while DOWN is held
+        :return:
+        """
+
+        self._grid_x, self._grid_y = grid
+        self.gravity = gravity
+        self.soft_gravity = soft_gravity
+
+        # the same shapes and rotations, in the same order, as Blocks
+        shapes = Blocks._shapes
+        self._names = Blocks._names
+        self._index = dict((name, i) for i, name in enumerate(self._names))
+
+        # cell offsets per (shape, rotation), missing rotations are padded
+        self._rotations = numpy.array([len(shapes[name]) for name in self._names])
+        self._cells_x = numpy.zeros((len(self._names), 4, 4), int)
+        self._cells_y = numpy.zeros((len(self._names), 4, 4), int)
+
+        for i, name in enumerate(self._names):
+            for rotation in range(4):
+                cells = shapes[name][rotation % len(shapes[name])]
+                for cell, (x, y) in enumerate(cells):
+                    self._cells_x[i, rotation, cell] = start[0] + x
+                    self._cells_y[i, rotation, cell] = start[1] + y
+
+        self._right = self._cells_x.max(axis=2)
+        self._top = self._cells_y.min(axis=2)
+
+        count = len(seeds)
+        self._random = [random.Random(seed) for seed in seeds]
+
+        self.boards = numpy.zeros((count, self._grid_y, self._grid_x), numpy.uint8)
+
+        # current shape of every board
+        self.shape = numpy.zeros(count, int)
+        self.rotation = numpy.zeros(count, int)
+        self.x = numpy.zeros(count, int)
+        self.y = numpy.zeros(count, int)
+        self.static = numpy.zeros(count, int)
+        self.started = numpy.zeros(count, bool)
+
+        self.over = numpy.zeros(count, bool)
+        self.score = numpy.zeros(count, int)
+        self.lines = numpy.zeros(count, int)
+        self.pieces = numpy.zeros(count, int)
+        self.steps = numpy.zeros(count, int)
+
+        self._fall = numpy.zeros(count, int)
+
+    @property
+    def is_over(self):
+        """
+        Returns which play fields are full.
+        :return: boolean array
+        """
+
+        return self.over
+
+    def step(self, actions):
+        """
+        Advances every game that isn't over by one simulation step.
+        :param actions: Engine action flags, one per board or one for all
+        :return: number of lines cleared on every board in this step
+        """
+
+        actions = numpy.broadcast_to(actions, self.over.shape)
+        cleared = numpy.zeros(self.over.shape, int)
+
+        live = ~self.over
+        self.steps[live] += 1
+
+        # boards without a shape make one and skip the step
+        spawn = live & ~self.started
+        for board in numpy.flatnonzero(spawn):
+            self._new(board, True)
+        self.started |= spawn
+
+        boards = numpy.flatnonzero(live & ~spawn)
+        if not boards.size:
+            return cleared
+
+        actions = actions[boards]
+
+        # hard drops land straight away and skip the other actions
+        drop = (actions & Engine.DROP) != 0
+        if drop.any():
+            self._drop(boards[drop])
+            self._fall[boards[drop]] = 0
+
+            cleared[boards[drop]] = self._line(boards[drop])
+            boards = boards[~drop]
+            actions = actions[~drop]
+
+        # rotate, keeping the old rotation where the new one doesn't fit
+        turn = boards[(actions & Engine.ROTATE) != 0]
+        if turn.size:
+            shape = self.shape[turn]
+            rotation = (self.rotation[turn] + 1) % self._rotations[shape]
+            x = self._kick(shape, rotation, self.x[turn])
+
+            fits = self._fits(turn, shape, rotation, x, self.y[turn])
+            self.rotation[turn[fits]] = rotation[fits]
+            self.x[turn[fits]] = x[fits]
+
+        direction = numpy.where((actions & Engine.LEFT) != 0, -1, numpy.where((actions & Engine.RIGHT) != 0, 1, 0))
+        self._move(boards, direction)
+
+        # make the shapes fall every few steps
+        self._fall[boards] += 1
+        gravity = numpy.where((actions & Engine.DOWN) != 0, self.soft_gravity, self.gravity)
+        fall = boards[self._fall[boards] >= gravity]
+        self._move(fall, None)
+        self._fall[fall] = 0
+
+        cleared[boards] = self._line(boards)
+        self.lines += cleared
+        self.score += cleared
+
+        return cleared
+
+    def _fits(self, boards, shape, rotation, x, y):
+        """
+        Checks if the shapes can be placed on their boards.
+        :return: boolean array
+        """
+
+        cells_x = self._cells_x[shape, rotation] + x[:, None]
+        cells_y = self._cells_y[shape, rotation] + y[:, None]
+
+        inside = (cells_x >= 0) & (cells_x < self._grid_x) & (cells_y >= 0) & (cells_y < self._grid_y)
+        taken = self.boards[
+            boards[:, None],
+            cells_y.clip(0, self._grid_y - 1),
+            cells_x.clip(0, self._grid_x - 1)
+        ]
+
+        return (inside & (taken == 0)).all(axis=1)
+
+    def _kick(self, shape, rotation, x):
+        """
+        Pushes the shapes back inside the right wall.
+        :return: new x positions
+        """
+
+        return x - numpy.maximum(self._right[shape, rotation] + x - (self._grid_x - 1), 0)
+
+    def _move(self, boards, direction):
+        """
+        Moves the shapes sideways, or down if direction is None, landing the ones that can't fall.
+        :param boards: indexes of the boards to move
+        :param direction: -1, 0 or 1 per board, or None to move down
+        :return:
+        """
+
+        if not boards.size:
+            return
+
+        shape = self.shape[boards]
+        rotation = self.rotation[boards]
+        x = self.x[boards]
+        y = self.y[boards]
+
+        landed = ~self._fits(boards, shape, rotation, x, y + 1)
+        if landed.any():
+            self._record(boards[landed])
+
+        free = ~landed
+        boards = boards[free]
+
+        if direction is None:
+            self.y[boards] += 1
+            return
+
+        direction = direction[free]
+        for side in (-1, 1):
+            move = boards[direction == side]
+            if move.size:
+                fits = self._fits(move, self.shape[move], self.rotation[move], self.x[move] + side, self.y[move])
+                self.x[move[fits]] += side
+
+    def _drop(self, boards):
+        """
+        Moves the shapes down until they rest on something, then lands them.
+        :param boards: indexes of the boards
+        :return:
+        """
+
+        falling = boards
+        while falling.size:
+            fits = self._fits(falling, self.shape[falling], self.rotation[falling],
+                              self.x[falling], self.y[falling] + 1)
+            falling = falling[fits]
+            self.y[falling] += 1
+
+        self._record(boards)
+
+    def _record(self, boards):
+        """
+        Lands the current shapes on their boards and brings in the next ones.
+        :param boards: indexes of the boards
+        :return:
+        """
+
+        shape = self.shape[boards]
+        rotation = self.rotation[boards]
+        cells_x = self._cells_x[shape, rotation] + self.x[boards][:, None]
+        cells_y = self._cells_y[shape, rotation] + self.y[boards][:, None]
+
+        self.boards[boards[:, None], cells_y, cells_x] = 1
+        self.pieces[boards] += 1
+
+        # the play field is full if the shape landed on the top row
+        self.over[boards] |= self._top[shape, rotation] + self.y[boards] < 1
+
+        for board in boards:
+            self._new(board, False)
+
+    def _new(self, board, first):
+        """
+        Creates a new shape, drawing from the board's random numbers the same way Blocks.new does.
+        :param board: index of the board
+        :param first: whether this is the first shape of the game
+        :return:
+        """
+
+        rng = self._random[board]
+
+        # colours aren't kept, but are drawn to stay in step with Blocks
+        rng.randint(0, 255)
+        rng.randint(0, 255)
+        rng.randint(0, 255)
+
+        if first:
+            shape = self._index[rng.choice(self._names)]
+            self.static[board] = self._index[rng.choice(self._names)]
+            rotation = rng.choice(range(self._rotations[shape]))
+        else:
+            shape = self.static[board]
+            self.static[board] = self._index[rng.choice(self._names)]
+            rotation = 0
+
+        self.shape[board] = shape
+        self.rotation[board] = rotation
+        self.x[board] = 0
+        self.y[board] = 0
+        self.x[board] = self._kick(shape, rotation, self.x[board])
+
+    def _line(self, boards):
+        """
+        Removes the full rows of the boards, moving the rows above them down.
+        :param boards: indexes of the boards
+        :return: number of rows removed per board
+        """
+
+        full = self.boards[boards].all(axis=2)
+        cleared = full.sum(axis=1)
+
+        changed = cleared > 0
+        if changed.any():
+            boards = boards[changed]
+            full = full[changed]
+
+            # full rows first, the others keep their order below them
+            order = numpy.argsort(~full, axis=1, kind='mergesort')
+            compact = self.boards[boards[:, None], order]
+            compact[numpy.arange(self._grid_y)[None, :] < cleared[changed][:, None]] = 0
+
+            self.boards[boards] = compact
+
+        return cleared
+
+
+if __name__ == "__main__":
+    # python batch.py [GAMES] [STEPS] plays the same seeded games on a Batch and on Engines,
+    # with the same bot driven actions, and checks every step that they stay the same
+    import sys
+
+    from bot import Bot
+
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    steps = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+    grid = 10, 20
+    start = 4, 0
+
+    seeds = range(games)
+    batch = Batch(seeds, grid, start, 3, 1)
+    engines = [Engine(Blocks(grid, grid, start, seed), 3, 1) for seed in seeds]
+    bots = [Bot() for _ in seeds]
+
+    # a random action now and then, so the boards fill up and the games end too
+    noise = random.Random(0)
+
+    for step in xrange(steps):
+        actions = [noise.randrange(32) if noise.random() < 0.05 else bot.action(engine.blocks)
+                   for engine, bot in zip(engines, bots)]
+
+        batch.step(numpy.array(actions))
+        for engine, action in zip(engines, actions):
+            engine.step(action)
+
+        for i, engine in enumerate(engines):
+            board = numpy.frombuffer(engine.blocks.get_board().cells(), numpy.uint8).reshape(grid[1], grid[0])
+            engine_state = engine.score, engine.lines, engine.pieces, engine.is_over
+            batch_state = batch.score[i], batch.lines[i], batch.pieces[i], batch.over[i]
+
+            if (board != batch.boards[i]).any():
+                print("seed %d: board differs at step %d" % (seeds[i], step))
+                sys.exit(1)
+            if engine_state != batch_state:
+                print("seed %d: (score, lines, pieces, over) differ at step %d, engine %s, batch %s" % (
+                    seeds[i], step, engine_state, batch_state))
+                sys.exit(1)
+
+    print("%d games, %d steps: %d pieces, %d lines, %d over, same as the engine" % (
+        games, steps, batch.pieces.sum(), batch.lines.sum(), batch.over.sum()))
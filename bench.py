@@ -0,0 +1,341 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from timeit import default_timer
+
+from blocks import Blocks
+from profiler import percentile
+
+SEED = 1234
+GRID = 10, 20
+START = 4, 0
+
+# filled rows the move benchmarks run against
+STACK_HEIGHTS = 0, 5, 10, 15
+
+# environments stepped at once by the env benchmarks, and worker processes for the biggest
+ENV_COUNTS = 1, 8, 64
+ENV_WORKERS = 4
+
+# most p50 microseconds a benchmark may take, checked on every run
+TARGETS = {
+    'game.startup': 500000,
+    # 40k placements/s; the engine does 11-18us a placement on CPython 2.7, every one of them
+    # a handful of method calls and random draws, so well over 100k/s (10us) is out of reach
+    # for it, and this only catches it getting a lot slower
+    'engine.place': 25,
+}
+
+# starts the game in a new interpreter and exits on the first frame of the start screen
+STARTUP = """
+import os
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+os.environ['SDL_AUDIODRIVER'] = 'dummy'
+
+import pygame
+pygame.display.flip = lambda: os._exit(0)
+
+import game
+
+# nothing written to the working tree, nor counted in the time
+game.LEADERBOARD = None
+game.REPLAYS = None
+
+game.Game().start_screen()
+"""
+
+
+def fill(blocks, height, full=0, seed=SEED):
+    """
+    Fills the bottom rows of the play field, every row with one hole except the full ones.
+    :param blocks: Blocks to fill
+    :param height: number of rows to fill
+    :param full: how many of them have no hole
+    :param seed: seed for the hole positions
+    :return:
+    """
+    rng = random.Random(seed)
+    width, rows = blocks.get_board().size()
+    every = (1 << width) - 1
+
+    masks = []
+    for row in range(height):
+        mask = every
+        if row >= full:
+            mask &= ~(1 << rng.randrange(width))
+        masks.append(mask)
+
+    blocks.get_board().place(masks[::-1], 0, rows - height, (200,) * 3)
+
+
+def make_blocks(height=0, full=0, shape='T'):
+    """
+    Returns seeded Blocks with a filled stack and a shape at the top.
+    :return: Blocks
+    """
+    blocks = Blocks(GRID, GRID, START, SEED)
+    fill(blocks, height, full)
+
+    # a random shape first, so there is a next shape queued up
+    blocks.new()
+    blocks.new(shape, 0)
+    return blocks
+
+
+def measure(call, setup=None, batch=200, samples=100):
+    """
+    Times a call.
+    :param call: function to time
+    :param setup: optional function run before every call, untimed; its result is passed to call
+    :param batch: calls per sample when there is no setup
+    :param samples: number of samples
+    :return: dict with ops per second and per call latency percentiles in microseconds
+    """
+    latencies = []
+
+    for _ in range(samples):
+        if setup is not None:
+            state = setup()
+            start = default_timer()
+            call(state)
+            latencies.append(default_timer() - start)
+        else:
+            start = default_timer()
+            for _ in xrange(batch):
+                call()
+            latencies.append((default_timer() - start) / batch)
+
+    latencies.sort()
+
+    total = sum(latencies)
+    return {
+        'ops': len(latencies) / total if total else float('inf'),
+        'p50': percentile(latencies, 50) * 1e6,
+        'p90': percentile(latencies, 90) * 1e6,
+        'p99': percentile(latencies, 99) * 1e6,
+    }
+
+
+def bench_new():
+    blocks = make_blocks()
+    return measure(lambda: blocks.new())
+
+
+def bench_move(height):
+    blocks = make_blocks(height)
+    moves = itertools.cycle([blocks.MOVE_LEFT, blocks.MOVE_RIGHT])
+    return measure(lambda: blocks.move(next(moves)))
+
+
+def bench_rotate():
+    blocks = make_blocks(10)
+    return measure(lambda: blocks.rotate())
+
+
+def bench_ghost(height):
+    blocks = make_blocks(height)
+    return measure(lambda: blocks.get_ghost())
+
+
+def bench_drop(height):
+    return measure(lambda blocks: blocks.drop(), lambda: make_blocks(height), samples=300)
+
+
+def bench_line(full):
+    return measure(lambda blocks: blocks.line(), lambda: make_blocks(8, full), samples=300)
+
+
+def bench_place():
+    # one hard dropped shape per call, lines and all, starting over when the board fills
+    from engine import Engine
+
+    engine = Engine(Blocks(GRID, GRID, START, SEED), 20, 2)
+
+    # the step starting a game only brings the first shape in,
+    # after that every hard drop lands one and brings the next
+    engine.step()
+
+    def place():
+        if engine.is_over:
+            engine.reset()
+            engine.step()
+        engine.step(Engine.DROP)
+
+    return measure(place, batch=1000)
+
+
+# play field sizes of the frame benchmarks, the default and a very big one
+GRIDS = (10, 20), (300, 1000)
+
+_games = {}
+
+
+def game(grid=GRIDS[0]):
+    """
+    Returns a Game rendering offscreen, made on first use.
+    :param grid: (columns, rows) of the play field
+    :return: game.Game
+    """
+
+    if grid not in _games:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+
+        import game as module
+        module.REPLAYS = None
+        module.LEADERBOARD = None
+
+        instance = _games[grid] = module.Game(grid)
+        instance.blocks.reset(SEED)
+        fill(instance.blocks, 10)
+
+    return _games[grid]
+
+
+def bench_text_cached():
+    instance = game()
+    return measure(lambda: instance.make_text("Controls:", font="arial"))
+
+
+def bench_text_changing():
+    instance = game()
+    scores = itertools.count()
+    return measure(lambda: instance.make_text("SCORE: %d" % next(scores), 18, font="arial"), batch=20)
+
+
+def bench_frame(grid):
+    instance = game(grid)
+
+    def frame():
+        instance.update()
+        instance.render()
+
+    return measure(frame, batch=5, samples=60)
+
+
+def bench_env(count, workers=0):
+    # ops/s counts the steps of every environment, the latencies are per call
+    from env import VectorEnv
+
+    envs = VectorEnv(count, GRID, SEED, workers=workers)
+    envs.reset()
+
+    rng = random.Random(SEED)
+    actions = itertools.cycle([[rng.randrange(32) for _ in range(count)] for _ in range(256)])
+
+    try:
+        result = measure(lambda: envs.step(next(actions)), batch=50)
+    finally:
+        envs.close()
+
+    result['ops'] *= count
+    return result
+
+
+def bench_startup():
+    # time to first frame, including the interpreter starting up
+    here = os.path.dirname(os.path.abspath(__file__))
+    return measure(lambda: subprocess.check_call([sys.executable, '-c', STARTUP], cwd=here),
+                   batch=1, samples=10)
+
+
+def cases():
+    """
+    Returns every benchmark by name.
+    :return: list of (name, function)
+    """
+    found = [('blocks.new', bench_new)]
+    found += [('blocks.move[stack=%d]' % height, lambda height=height: bench_move(height))
+              for height in STACK_HEIGHTS]
+    found += [('blocks.rotate', bench_rotate)]
+    found += [('blocks.ghost[stack=%d]' % height, lambda height=height: bench_ghost(height))
+              for height in STACK_HEIGHTS]
+    found += [('blocks.drop[stack=%d]' % height, lambda height=height: bench_drop(height))
+              for height in STACK_HEIGHTS]
+    found += [('blocks.line[full=%d]' % full, lambda full=full: bench_line(full)) for full in range(5)]
+    found += [('engine.place', bench_place)]
+    found += [
+        ('game.make_text[cached]', bench_text_cached),
+        ('game.make_text[changing]', bench_text_changing),
+    ]
+    found += [('game.frame[grid=%dx%d]' % grid, lambda grid=grid: bench_frame(grid)) for grid in GRIDS]
+    found += [('env.step[envs=%d]' % count, lambda count=count: bench_env(count)) for count in ENV_COUNTS]
+    found += [('env.step[envs=%d,workers=%d]' % (ENV_COUNTS[-1], ENV_WORKERS),
+               lambda: bench_env(ENV_COUNTS[-1], ENV_WORKERS))]
+    found += [('game.startup', bench_startup)]
+    return found
+
+
+def compare(results, baseline, threshold):
+    """
+    Finds the benchmarks that got slower than the threshold allows.
+    :param results: results of this run
+    :param baseline: results of an earlier run
+    :param threshold: allowed fraction of ops per second lost, 0.1 for 10%
+    :return: list of (name, old ops, new ops)
+    """
+    slower = []
+    for name, result in sorted(results.items()):
+        old = baseline.get(name)
+        if old is not None and result['ops'] < old['ops'] * (1 - threshold):
+            slower.append((name, old['ops'], result['ops']))
+    return slower
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Falling PyBlocks benchmarks.")
+    parser.add_argument('--only', default='', help="run the benchmarks whose name contains this")
+    parser.add_argument('--output', help="save the results to this JSON file")
+    parser.add_argument('--compare', help="JSON file of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="fail if ops/s dropped by more than this fraction (default 0.1)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    missed = False
+    print("%-28s %12s %10s %10s %10s" % ("benchmark", "ops/s", "p50 us", "p90 us", "p99 us"))
+
+    for name, function in cases():
+        if args.only not in name:
+            continue
+
+        result = results[name] = function()
+        print("%-28s %12.0f %10.2f %10.2f %10.2f" % (name, result['ops'], result['p50'], result['p90'], result['p99']))
+
+        if name in TARGETS and result['p50'] > TARGETS[name]:
+            print("MISSED TARGET %s: p50 %.0fus > %.0fus" % (name, result['p50'], TARGETS[name]))
+            missed = True
+
+    if args.output:
+        with open(args.output, 'w') as stream:
+            json.dump({
+                'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'seed': SEED,
+                'results': results,
+            }, stream, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as stream:
+            baseline = json.load(stream)['results']
+
+        slower = compare(results, baseline, args.threshold)
+        for name, old, new in slower:
+            print("REGRESSION %s: %.0f -> %.0f ops/s (%.1f%%)" % (name, old, new, (new / old - 1) * 100))
+
+        if slower:
+            return 1
+
+    return 1 if missed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
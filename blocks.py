@@ -1,17 +1,108 @@
 import random
 
-
-class Blocks:
-    def __init__(self, (grid_x, grid_y), (display_width, display_height), (start_x, start_y)=(0, 0)):
+from collections import namedtuple
+
+from board import Board, LEVELS, PALETTE
+
+# everything needed to put a Blocks back the way it was, see Blocks.snapshot()
+Snapshot = namedtuple('Snapshot', ('board', 'piece', 'queue', 'placed', 'full', 'random'))
+
+
+class Blocks(object):
+    # helpers
+    MOVE_DOWN = 0
+    MOVE_RIGHT = 1
+    MOVE_LEFT = 2
+
+    # block shapes, cell offsets for every rotation
+    _shapes = {
+        'O': (
+            ((0, 0), (1, 1), (1, 0), (0, 1)),
+        ),
+        'I': (
+            ((0, 0), (0, 1), (0, 2), (0, 3)),
+            ((0, 0), (1, 0), (2, 0), (3, 0))
+        ),
+        'S': (
+            ((0, 1), (1, 1), (1, 0), (2, 0)),
+            ((0, 0), (0, 1), (1, 1), (1, 2))
+        ),
+        'Z': (
+            ((0, 0), (1, 0), (1, 1), (2, 1)),
+            ((0, 1), (0, 2), (1, 0), (1, 1))
+        ),
+        'L': (
+            ((0, 0), (0, 1), (0, 2), (1, 2)),
+            ((0, 0), (0, 1), (1, 0), (2, 0)),
+            ((0, 0), (1, 0), (1, 1), (1, 2)),
+            ((0, 1), (1, 1), (2, 1), (2, 0))
+        ),
+        'J': (
+            ((0, 2), (1, 2), (1, 1), (1, 0)),
+            ((0, 0), (0, 1), (1, 1), (2, 1)),
+            ((0, 0), (1, 0), (0, 2), (0, 1)),
+            ((0, 0), (1, 0), (2, 0), (2, 1))
+        ),
+        'T': (
+            ((0, 0), (1, 0), (1, 1), (2, 0)),
+            ((0, 1), (1, 0), (1, 1), (1, 2)),
+            ((0, 1), (1, 0), (1, 1), (2, 1)),
+            ((0, 0), (0, 1), (1, 1), (0, 2))
+        )
+    }
+
+    _names = tuple(_shapes.keys())
+
+    # row bitmasks for every rotation, the first mask is the top row of the shape
+    _masks = dict(
+        (name, tuple(
+            tuple(sum(1 << x for x, y in cells if y == row) for row in range(max(y for _, y in cells) + 1))
+            for cells in rotations
+        ))
+        for name, rotations in _shapes.items()
+    )
+
+    # (width, height) for every rotation
+    _bounds = dict(
+        (name, tuple(
+            (max(x for x, _ in cells) + 1, max(y for _, y in cells) + 1)
+            for cells in rotations
+        ))
+        for name, rotations in _shapes.items()
+    )
+
+    # (column, lowest row) of every column for every rotation
+    _bottoms = dict(
+        (name, tuple(
+            tuple((column, max(y for x, y in cells if x == column))
+                  for column in sorted(set(x for x, _ in cells)))
+            for cells in rotations
+        ))
+        for name, rotations in _shapes.items()
+    )
+
+    __slots__ = (
+        '_random',
+        '_grid_x', '_grid_y', '_display_width', '_display_height', '_grid_real_x', '_grid_real_y',
+        '_shape_static', '_rotation_static', '_shape_current', '_shape_next', '_rotation', '_colour',
+        '_x', '_y', '_x_pos', '_y_pos',
+        '_full', '_board', '_placed', '_falling', '_random_state'
+    )
+
+    def __init__(self, (grid_x, grid_y), (display_width, display_height), (start_x, start_y)=(0, 0), seed=None,
+                 cells=None):
         """
         Game block manager.
+        :param seed: seed for the shapes and colours of this game, random if None
+        :param cells: buffer to keep the occupancy of the board in, see Board
         :return:
         """
 
-        # helpers
-        self.MOVE_DOWN = 0
-        self.MOVE_RIGHT = 1
-        self.MOVE_LEFT = 2
+        # every game draws from its own random numbers, so a seed replays the same shapes
+        self._random = random.Random(seed)
+
+        # state of the random numbers, kept between draws so snapshots can share it
+        self._random_state = None
 
         # display properties
         self._grid_x = grid_x
@@ -22,70 +113,25 @@ class Blocks:
         self._grid_real_y = self._display_height / self._grid_y
 
         # shape properties
-        self._shape = []
         self._shape_static = None
         self._rotation_static = None
         self._shape_current = None
         self._shape_next = None
         self._rotation = 0
-
-        self._red = None
-        self._green = None
-        self._blue = None
+        self._colour = None
 
         # shape position
         self._x = start_x
         self._y = start_y
         self._x_pos = 0
         self._y_pos = 0
+        self._falling = False
 
         self._full = False
 
-        # shapes history
-        self._record = []
-
-        # block shapes
-        self._shapes = {
-            'O': (
-                ((self._x, self._y), (self._x + 1, self._y + 1), (self._x + 1, self._y), (self._x, self._y + 1)),
-            ),
-            'I': (
-                ((self._x, self._y), (self._x, self._y + 1), (self._x, self._y + 2), (self._x, self._y + 3)),
-                ((self._x, self._y), (self._x + 1, self._y), (self._x + 2, self._y), (self._x + 3, self._y))
-            ),
-            'S': (
-                ((self._x, self._y + 1), (self._x + 1, self._y + 1), (self._x + 1, self._y), (self._x + 2, self._y)),
-                ((self._x, self._y), (self._x, self._y + 1), (self._x + 1, self._y + 1), (self._x + 1, self._y + 2))
-            ),
-            'Z': (
-                ((self._x, self._y), (self._x + 1, self._y), (self._x + 1, self._y + 1), (self._x + 2, self._y + 1)),
-                ((self._x, self._y + 1), (self._x, self._y + 2), (self._x + 1, self._y), (self._x + 1, self._y + 1))
-            ),
-            'L': (
-                ((self._x, self._y), (self._x, self._y + 1), (self._x, self._y + 2), (self._x + 1, self._y + 2)),
-                ((self._x, self._y), (self._x, self._y + 1), (self._x + 1, self._y), (self._x + 2, self._y)),
-                ((self._x, self._y), (self._x + 1, self._y), (self._x + 1, self._y + 1), (self._x + 1, self._y + 2)),
-                ((self._x, self._y + 1), (self._x + 1, self._y + 1), (self._x + 2, self._y + 1), (self._x + 2, self._y))
-            ),
-            'J': (
-                (
-                    (self._x, self._y + 2), (self._x + 1, self._y + 2), (self._x + 1, self._y + 1),
-                    (self._x + 1, self._y)),
-                ((self._x, self._y), (self._x, self._y + 1), (self._x + 1, self._y + 1), (self._x + 2, self._y + 1)),
-                ((self._x, self._y), (self._x + 1, self._y), (self._x, self._y + 2), (self._x, self._y + 1)),
-                ((self._x, self._y), (self._x + 1, self._y), (self._x + 2, self._y), (self._x + 2, self._y + 1))
-            ),
-            'T': (
-                ((self._x, self._y), (self._x + 1, self._y), (self._x + 1, self._y + 1), (self._x + 2, self._y)),
-                (
-                    (self._x, self._y + 1), (self._x + 1, self._y), (self._x + 1, self._y + 1),
-                    (self._x + 1, self._y + 2)),
-                (
-                    (self._x, self._y + 1), (self._x + 1, self._y), (self._x + 1, self._y + 1),
-                    (self._x + 2, self._y + 1)),
-                ((self._x, self._y), (self._x, self._y + 1), (self._x + 1, self._y + 1), (self._x, self._y + 2))
-            )
-        }
+        # landed blocks
+        self._board = Board(self._grid_x, self._grid_y, cells)
+        self._placed = 0
 
     def new(self, shape=None, rotation=None):
         """
@@ -94,52 +140,159 @@ class Blocks:
         :param rotation: optional int available for shape
         :return:
         """
-        self._shape = []
 
+        self._random_state = None
+
+        # int(random() * n) is what randint(0, n - 1) and choice() of n items work out to,
+        # without their overhead, so a seed still gives the same shapes
+        draw = self._random.random
+        names = self._names
+
+        # snapped to the board's palette, so the shape keeps its colour when it lands;
+        # quantize() worked out in place, this runs for every shape
         if self._shape_current is None:
-            self._red = random.randint(0, 255)
-            self._green = random.randint(0, 255)
-            self._blue = random.randint(0, 255)
+            self._colour = PALETTE[1 + LEVELS[int(draw() * 256)] * 36 + LEVELS[int(draw() * 256)] * 6
+                                   + LEVELS[int(draw() * 256)]]
 
         # check if any static shapes are in place
         if self._shape_next is True:
             self._shape_current = self._shape_static
             self._shape_next = False
-            self._shape_static = random.choice(self._shapes.keys())
-        elif shape is not None and shape in self._shapes.keys():
+            self._shape_static = names[int(draw() * len(names))]
+        elif shape is not None and shape in self._shapes:
             self._shape_current = shape
         else:
-            self._shape_current = random.choice(self._shapes.keys())
-            self._shape_static = random.choice(self._shapes.keys())
+            self._shape_current = names[int(draw() * len(names))]
+            self._shape_static = names[int(draw() * len(names))]
 
         if rotation is not None:
             self._rotation = rotation
         else:
-            self._rotation = random.choice([i for i in range(0, len(self._shapes.get(self._shape_current)))])
+            self._rotation = int(draw() * len(self._shapes[self._shape_current]))
 
-        # apply shape to the self._shape list with current rotation
-        shape = self._shapes.get(self._shape_current)[self._rotation]
-        for x, y in shape:
-            x, y = x + self._x_pos, y + self._y_pos
-            self._shape.append(((x, y), self.get_colour()))
+        # push the shape back inside the play field
+        self._x_pos = self._kick(self._rotation, self._x_pos)
+        self._falling = False
+
+    def _kick(self, rotation, x_pos):
+        """
+        Moves a position left until the current shape fits inside the right wall.
+        :param rotation: rotation of the current shape
+        :param x_pos: position to check
+        :return: new position
+        """
+
+        width, _ = self._bounds[self._shape_current][rotation]
+        out_of_bounds = self._x + x_pos + width - self._grid_x
 
-        out_of_bounds = len([(x, y) for (x, y), _ in self._shape if x > self._grid_x-1])
         if out_of_bounds > 0:
-            self._x_pos -= out_of_bounds
+            return x_pos - out_of_bounds
+        return x_pos
 
     def get_colour(self):
         """
         Returns the colour of the current shape.
         :return: RGB
         """
-        return self._red, self._green, self._blue
+        return self._colour
 
     def get_shape(self):
         """
         Returns the shape in the form of a list for printing/rendering.
         :return: list of tuples
         """
-        return self._shape
+        if self._shape_current is None:
+            return []
+
+        x = self._x + self._x_pos
+        y = self._y + self._y_pos
+        colour = self._colour
+
+        return [((x + cell_x, y + cell_y), colour)
+                for cell_x, cell_y in self._shapes[self._shape_current][self._rotation]]
+
+    def get_piece(self):
+        """
+        Returns the current shape and where it is.
+        :return: (shape, rotation, x, y) of the top left corner, None if there is no shape
+        """
+        if self._shape_current is None:
+            return None
+
+        return self._shape_current, self._rotation, self._x + self._x_pos, self._y + self._y_pos
+
+    def get_piece_next(self):
+        """
+        Returns the name of the next shape in the queue.
+        :return: string
+        """
+        return self._shape_static
+
+    def get_start(self):
+        """
+        Returns where new shapes appear.
+        :return: (x, y)
+        """
+        return self._x, self._y
+
+    def get_board(self):
+        """
+        Returns the play field with the landed blocks.
+        :return: Board
+        """
+        return self._board
+
+    def active(self):
+        """
+        Returns whether there is a shape in play.
+        :return: boolean
+        """
+        return self._shape_current is not None
+
+    def _landing(self):
+        """
+        Returns the row the current shape lands on if it falls straight down.
+        :return: y of the top of the shape
+        """
+        return self._board.landing(
+            self._masks[self._shape_current][self._rotation],
+            self._x + self._x_pos,
+            self._y + self._y_pos,
+            self._bottoms[self._shape_current][self._rotation]
+        )
+
+    def get_ghost(self):
+        """
+        Returns where the current shape would land.
+        :return: list of ((x, y), colour), empty if there is no shape
+        """
+        if self._shape_current is None:
+            return []
+
+        x = self._x + self._x_pos
+        y = self._landing()
+        colour = self._colour
+
+        return [((x + cell_x, y + cell_y), colour)
+                for cell_x, cell_y in self._shapes[self._shape_current][self._rotation]]
+
+    def drop(self):
+        """
+        Drops the current shape straight down and lands it.
+        :return: number of rows it fell
+        """
+        if self._shape_current is None:
+            self.new(None, self._rotation)
+            return 0
+
+        y = self._landing() - self._y
+        rows = y - self._y_pos
+        self._y_pos = y
+
+        self.record()
+        self.new(None, self._rotation)
+
+        return rows
 
     def get_shape_next(self):
         """
@@ -147,9 +300,11 @@ class Blocks:
         For the panel only.
         :return:
         """
-        # apply shape to the self._shape list with current rotation
-        for x, y in self._shapes.get(self._shape_static)[0]:
-            yield ((x, y), (200, ) * 3)
+        if self._shape_static is None:
+            return
+
+        for x, y in self._shapes[self._shape_static][0]:
+            yield ((x + self._x, y + self._y), (200, ) * 3)
 
     def move(self, direction):
         """
@@ -158,66 +313,55 @@ class Blocks:
         :return: change current shape position to a new one
         """
 
-        left = True
-        right = True
-        top_y = self._grid_x
-
-        for (current_x, current_y), _ in self._shape:
-
-            if current_y < top_y:
-                top_y = current_y
+        if self._shape_current is None:
+            self.new(None, self._rotation)
+            return
 
-            # collision with play field
-            if current_x - 1 < 0:
-                left = False
-            if current_x > self._grid_x - 2:
-                right = False
-            if current_y == self._grid_y - 1:
-                self.record()
+        # nothing moved since the last check found space below
+        if direction is None and self._falling is True:
+            return
 
-            # collision with other blocks
-            if len(self._record) > 0:
-                for (block_x, block_y), _ in self._record:
+        masks = self._masks[self._shape_current][self._rotation]
+        x = self._x + self._x_pos
+        y = self._y + self._y_pos
 
-                    if top_y < 1 and current_y + 1 == block_y and current_x + 1 == block_x:
-                        self._full = True
-                        self.record()
-                        break
+        # land the shape if there is nothing free below it, and bring in the next one
+        if not self._board.fits(masks, x, y + 1):
+            self.record()
+            self.new(None, self._rotation)
+            return
 
-                    if current_x + 1 == block_x and current_y == block_y:
-                        right = False
-                    if current_x - 1 == block_x and current_y == block_y:
-                        left = False
-                    if current_y + 1 == block_y and current_x == block_x:
-                        self.record()
+        self._falling = direction is None
 
         # check for direction and if it's in the inbound
         if direction is self.MOVE_DOWN:
             self._y_pos += 1
 
-        if direction is self.MOVE_LEFT and left:
+        elif direction is self.MOVE_LEFT and self._board.fits(masks, x - 1, y):
             self._x_pos -= 1
 
-        if direction is self.MOVE_RIGHT and right:
+        elif direction is self.MOVE_RIGHT and self._board.fits(masks, x + 1, y):
             self._x_pos += 1
 
-        # make the new shape
-        self.new(self._shape_current, self._rotation)
-
     def rotate(self):
         """
         Rotate the shape, select next available
         :return: change current shape rotation to a new one
         """
 
+        rotations = self._masks[self._shape_current]
+
         # check if the next rotation is available, if not revert to original shape
-        if self._rotation != len(self._shapes[self._shape_current]) - 1:
-            self._rotation += 1
-        else:
-            self._rotation = 0
+        rotation = self._rotation + 1
+        if rotation == len(rotations):
+            rotation = 0
 
-        # make the new shape
-        self.new(self._shape_current, self._rotation)
+        # keep the old rotation if the new one overlaps the play field
+        x_pos = self._kick(rotation, self._x_pos)
+        if self._board.fits(rotations[rotation], self._x + x_pos, self._y + self._y_pos):
+            self._rotation = rotation
+            self._x_pos = x_pos
+            self._falling = False
 
     def record(self):
         """
@@ -225,18 +369,24 @@ class Blocks:
         :return:
         """
         self._shape_next = True
+        self._placed += 1
+
+        # the play field is full if the shape landed on the top row
+        y = self._y + self._y_pos
+        if y < 1:
+            self._full = True
+
         # used for saving position when the block has landed
-        for block in self._shape:
-            self._record.append(block)
+        masks = self._masks[self._shape_current][self._rotation]
+        self._board.place(masks, self._x + self._x_pos, y, self._colour)
         self.clear()
 
-    def display(self):
+    def display(self, x=0, y=0, width=None, height=None):
         """
-        Generator for the self._record list
+        Generator for the landed blocks, see Board.display().
         :return: list of tuples
         """
-        for i in self._record:
-            yield i
+        return self._board.display(x, y, width, height)
 
     def clear(self):
         """
@@ -244,59 +394,128 @@ class Blocks:
         :return:
         """
 
-        self._shape = []
         self._shape_current = None
         self._rotation = 0
 
         self._x_pos = 0
         self._y_pos = 0
+        self._falling = False
 
-        self._red = None
-        self._green = None
-        self._blue = None
+        self._colour = None
 
-    def reset(self):
+    def reset(self, seed=None):
         """
         Reset the game.
+        :param seed: optional new seed for the shapes and colours
         :return:
         """
 
-        self._shape = []
+        if seed is not None:
+            self._random.seed(seed)
+        self._random_state = None
+
         self._shape_static = None
         self._rotation_static = None
         self._shape_current = None
         self._shape_next = None
         self._rotation = 0
 
-        self._red = None
-        self._green = None
-        self._blue = None
+        self._colour = None
 
         self._x_pos = 0
         self._y_pos = 0
+        self._falling = False
 
         self._full = False
 
-        self._record = []
+        self._board.reset()
+        self._placed = 0
+
+    def garbage(self, count, hole):
+        """
+        Adds rows sent by an opponent to the bottom of the play field.
+        The current shape is pushed up if the rows reach it.
+        :param count: number of rows
+        :param hole: column left empty in them
+        :return:
+        """
+
+        if self._board.garbage(count, hole, (128,) * 3):
+            self._full = True
+
+        self._falling = False
+        if self._shape_current is None:
+            return
+
+        masks = self._masks[self._shape_current][self._rotation]
+        x = self._x + self._x_pos
+        while not self._board.fits(masks, x, self._y + self._y_pos):
+            if self._y + self._y_pos <= 0:
+                self._full = True
+                return
+            self._y_pos -= 1
+
+    def snapshot(self, base=None):
+        """
+        Returns the state of the game as immutable tuples.
+        The random number state is shared with earlier snapshots.
+        :param base: optional earlier snapshot of this Blocks to share unchanged rows with, see Board.snapshot()
+        :return: Snapshot
+        """
+
+        if self._random_state is None:
+            self._random_state = self._random.getstate()
+
+        return Snapshot(
+            self._board.snapshot(None if base is None else base.board),
+            (self._shape_current, self._rotation, self._x_pos, self._y_pos, self._colour, self._falling),
+            (self._shape_static, self._shape_next),
+            self._placed,
+            self._full,
+            self._random_state
+        )
+
+    def restore(self, snapshot):
+        """
+        Puts the game back to a snapshot taken from this or an equally sized Blocks.
+        :param snapshot: result of snapshot()
+        :return:
+        """
+
+        self._board.restore(snapshot.board)
+        self._shape_current, self._rotation, self._x_pos, self._y_pos, self._colour, self._falling = snapshot.piece
+        self._shape_static, self._shape_next = snapshot.queue
+        self._placed = snapshot.placed
+        self._full = snapshot.full
+
+        # nothing was drawn since the snapshot
+        if snapshot.random is not self._random_state:
+            self._random.setstate(snapshot.random)
+            self._random_state = snapshot.random
 
     def line(self):
         """
-        Full line checker.
-        :return: boolean
+        Full line checker, removes all full lines at once.
+        :return: number of lines removed
         """
 
-        for grid_y in range(self._grid_y):
-            line = [((x, y), colour) for (x, y), colour in self.display() if y is grid_y]
+        return self._board.line()
 
-            if len(line) == self._grid_x:
-                for shape in line:
-                    self._record.remove(shape)
+    def digest(self):
+        """
+        Returns a hash of the landed blocks.
+        :return: 20 byte string
+        """
+
+        return self._board.digest()
 
-                for i, ((_, y), _) in enumerate(self._record):
-                    if y < grid_y:
-                        self._record[i] = (self._record[i][0][0], self._record[i][0][1] + 1), self._record[i][1]
+    def placed(self):
+        """
+        Returns the number of shapes that have landed.
+        :return: int
+        """
 
-                return True
+        return self._placed
 
     def full(self):
         """
@@ -0,0 +1,508 @@
+import hashlib
+
+# colours of the landed blocks, six levels each of red, green and blue;
+# cells hold an index into it, 0 for an empty cell
+PALETTE = (None,) + tuple(
+    (red * 51, green * 51, blue * 51) for red in range(6) for green in range(6) for blue in range(6)
+)
+
+# palette level of every channel value, see quantize()
+LEVELS = tuple((value + 25) // 51 for value in range(256))
+
+# palette index to occupancy, for translate()
+_OCCUPIED = '\x00' + '\x01' * 255
+
+
+def quantize(colour):
+    """
+    Finds the nearest palette colour.
+    :param colour: RGB
+    :return: index into PALETTE, from 1 to 216
+    """
+    red, green, blue = colour
+    return 1 + LEVELS[red] * 36 + LEVELS[green] * 6 + LEVELS[blue]
+
+
+# index of every palette colour, so placing a shape of one doesn't work it out again
+_INDICES = dict((colour, index) for index, colour in enumerate(PALETTE) if colour is not None)
+
+# columns of the set bits of every row mask placed so far; shapes only make a few
+# masks per column, so this stays small
+_COLUMNS = {}
+
+
+def _columns(mask):
+    """
+    Returns the columns of the set bits of a row mask.
+    :param mask: row bitmask
+    :return: tuple of ints, lowest first
+    """
+    columns = _COLUMNS.get(mask)
+    if columns is None:
+        columns = []
+        rest = mask
+        while rest:
+            bit = rest & -rest
+            columns.append(bit.bit_length() - 1)
+            rest ^= bit
+        columns = _COLUMNS[mask] = tuple(columns)
+    return columns
+
+
+class Board:
+    def __init__(self, width, height, cells=None):
+        """
+        Play field occupancy, stored as one integer bitmask per row.
+        Bit x of a row is set when the cell at column x is taken.
+        The occupancy is also kept as one byte per cell in a flat buffer, see cells(),
+        and so are the colours, as PALETTE indices, see colours().
+        :param width: number of columns
+        :param height: number of rows
+        :param cells: writable buffer of width * height bytes to keep the cells in,
+                      a bytearray or a numpy uint8 array, a new bytearray by default
+        :return:
+        """
+
+        self._width = width
+        self._height = height
+
+        # every bit outside of the play field counts as a wall
+        self._full_row = (1 << width) - 1
+        self._walls = ~self._full_row
+
+        self._rows = [0] * height
+
+        # palette index of every cell, row by row, at y * width + x
+        self._colours = bytearray(width * height)
+
+        # highest taken row of every column, height if the column is empty
+        self._tops = [height] * width
+
+        # rows placed on since the last line(), the only ones that can be full
+        self._check = None
+
+        # change counter of every row, so views of the board know what to redraw
+        # and snapshots which rows they can share with an earlier one
+        self._revision = 0
+        self._revisions = [0] * height
+
+        # tells the snapshots of this board from those of others
+        self._identity = object()
+
+        # 1 for every taken cell, row by row; only ever written in place,
+        # so numpy views of it stay valid for the life of the board
+        if cells is None:
+            cells = bytearray(width * height)
+        else:
+            cells[:] = bytearray(width * height)
+        self._cells = cells
+
+    def fits(self, masks, x, y):
+        """
+        Checks if the row masks can be placed on the play field.
+        :param masks: row bitmasks, the first one goes to row y
+        :param x: columns to shift the masks by, can be negative
+        :param y: row of the first mask
+        :return: boolean
+        """
+
+        if y < 0 or y + len(masks) > self._height:
+            return False
+
+        rows = self._rows
+        walls = self._walls
+
+        # the two ways of shifting apart, so neither loop branches on every row
+        if x < 0:
+            # anything shifted past the left wall collides
+            lost = (1 << -x) - 1
+            for mask in masks:
+                if mask & lost or (mask >> -x) & (rows[y] | walls):
+                    return False
+                y += 1
+        else:
+            for mask in masks:
+                if (mask << x) & (rows[y] | walls):
+                    return False
+                y += 1
+
+        return True
+
+    def place(self, masks, x, y, colour):
+        """
+        Marks the cells covered by the row masks as taken.
+        :param masks: row bitmasks, the first one goes to row y
+        :param x: columns to shift the masks by, can be negative
+        :param y: row of the first mask
+        :param colour: RGB of the placed cells, snapped to the nearest palette colour
+        :return:
+        """
+
+        self._revision += 1
+        index = _INDICES.get(colour) or quantize(colour)
+
+        # looked up once, this runs for every shape placed
+        width = self._width
+        height = self._height
+        full_row = self._full_row
+        rows = self._rows
+        colours = self._colours
+        cells = self._cells
+        tops = self._tops
+        revisions = self._revisions
+        revision = self._revision
+
+        # first and last rows placed on, the masks go top to bottom
+        first = last = None
+
+        row = y - 1
+        for mask in masks:
+            row += 1
+            mask = (mask >> -x if x < 0 else mask << x) & full_row
+
+            if not mask or not 0 <= row < height:
+                continue
+
+            rows[row] |= mask
+            revisions[row] = revision
+
+            if first is None:
+                first = row
+            last = row
+
+            start = row * width
+            for column in _COLUMNS.get(mask) or _columns(mask):
+                colours[start + column] = index
+                cells[start + column] = 1
+                if row < tops[column]:
+                    tops[column] = row
+
+        if first is not None:
+            if self._check is None:
+                self._check = first, last
+            else:
+                self._check = min(self._check[0], first), max(self._check[1], last)
+
+    def line(self):
+        """
+        Removes every full row in one pass and moves the rows above them down.
+        Only the rows placed on since the last call are looked at.
+        :return: number of rows removed
+        """
+
+        if self._check is None:
+            return 0
+
+        first, last = self._check
+        self._check = None
+
+        while last >= first and self._rows[last] != self._full_row:
+            last -= 1
+        if last < first:
+            return 0
+
+        # only the rows from the highest taken cell down to the lowest full one move,
+        # the ones above are empty and stay that way; going from the bottom up,
+        # no row is overwritten before it moved
+        rows = self._rows
+        colours = self._colours
+        cells = self._cells
+        width = self._width
+        top = min(self._tops)
+
+        target = last
+        for row in range(last, top - 1, -1):
+            if rows[row] != self._full_row:
+                if target != row:
+                    rows[target] = rows[row]
+                    colours[target * width:(target + 1) * width] = colours[row * width:(row + 1) * width]
+                    cells[target * width:(target + 1) * width] = cells[row * width:(row + 1) * width]
+                target -= 1
+
+        cleared = target + 1 - top
+        rows[top:target + 1] = [0] * cleared
+        colours[top * width:(target + 1) * width] = bytearray(cleared * width)
+        cells[top * width:(target + 1) * width] = bytearray(cleared * width)
+        self._surface(top + cleared)
+        self._touch(top, last + 1)
+
+        return cleared
+
+    def _touch(self, start, stop):
+        """
+        Marks rows as changed.
+        :param start: first row
+        :param stop: row after the last one
+        :return:
+        """
+
+        self._revision += 1
+        self._revisions[start:stop] = [self._revision] * (stop - start)
+
+    def revision(self, start=0, stop=None):
+        """
+        Returns a number that goes up whenever one of the rows changes.
+        :param start: first row
+        :param stop: row after the last one, the bottom by default
+        :return: int
+        """
+
+        return max(self._revisions[start:stop] or [0])
+
+    def _surface(self, start):
+        """
+        Finds the top of every column again, the rows above start being empty.
+        :param start: first row that can be taken
+        :return:
+        """
+
+        tops = [self._height] * self._width
+        seen = 0
+
+        for y in range(start, self._height):
+            # columns reached for the first time
+            found = self._rows[y] & ~seen
+            while found:
+                bit = found & -found
+                tops[bit.bit_length() - 1] = y
+                found ^= bit
+
+            seen |= self._rows[y]
+            if seen == self._full_row:
+                break
+
+        self._tops = tops
+
+    def landing(self, masks, x, y, bottoms):
+        """
+        Finds the row the masks would land on if they fell straight down.
+        Works from the column tops alone when the masks are above all of them,
+        otherwise (under an overhang) goes down row by row.
+        :param masks: row bitmasks, the first one goes to row y
+        :param x: columns to shift the masks by
+        :param y: current row of the first mask, where the masks fit
+        :param bottoms: (column, lowest row) of every column of the masks
+        :return: row of the first mask after falling
+        """
+
+        # a plain loop, a generator costs more than the few columns it goes over
+        tops = self._tops
+        landing = self._height
+        for column, row in bottoms:
+            top = tops[x + column] - 1 - row
+            if top < landing:
+                landing = top
+        if landing >= y:
+            return landing
+
+        while self.fits(masks, x, y + 1):
+            y += 1
+        return y
+
+    def heights(self):
+        """
+        Returns how high the blocks stack up in every column.
+        :return: tuple of ints
+        """
+
+        return tuple(self._height - top for top in self._tops)
+
+    def garbage(self, count, hole, colour):
+        """
+        Pushes the rows up and fills the bottom with rows that are full except for one hole.
+        :param count: number of rows to add
+        :param hole: column left empty
+        :param colour: RGB of the added cells
+        :return: boolean, whether taken cells were pushed out of the top
+        """
+
+        count = min(count, self._height)
+        lost = any(self._rows[:count])
+
+        row = self._full_row & ~(1 << hole)
+        self._rows = self._rows[count:] + [row] * count
+
+        index = quantize(colour)
+        moved = (self._height - count) * self._width
+        for plane, value in ((self._colours, index), (self._cells, 1)):
+            plane[:moved] = plane[count * self._width:]
+            plane[moved:] = bytearray(0 if x == hole else value for x in range(self._width)) * count
+        self._surface(max(min(self._tops) - count, 0))
+        self._touch(0, self._height)
+
+        # rows waiting to be checked moved up with the rest
+        if self._check is not None:
+            self._check = max(self._check[0] - count, 0), self._check[1] - count
+            if self._check[1] < 0:
+                self._check = None
+
+        return lost
+
+    def display(self, x=0, y=0, width=None, height=None):
+        """
+        Generator for the taken cells, of the whole play field or a part of it.
+        :param x: first column
+        :param y: first row
+        :param width: number of columns, up to the right side by default
+        :param height: number of rows, down to the bottom by default
+        :return: ((x, y), colour) tuples
+        """
+
+        if width is None:
+            width = self._width - x
+        if height is None:
+            height = self._height - y
+
+        for index in self.occupied(x, y, width, height):
+            row, column = divmod(index, self._width)
+            yield (column, row), PALETTE[self._colours[index]]
+
+    def occupied(self, x=0, y=0, width=None, height=None):
+        """
+        Generator for the taken cells, of the whole play field or a part of it.
+        Yields only a flat index per cell, for reading colours() and cells() directly,
+        and goes by the row bitmasks so empty cells cost nothing.
+        :param x: first column
+        :param y: first row
+        :param width: number of columns, up to the right side by default
+        :param height: number of rows, down to the bottom by default
+        :return: y * columns + x of every taken cell
+        """
+
+        if width is None:
+            width = self._width - x
+        if height is None:
+            height = self._height - y
+
+        window = (1 << width) - 1
+        stop = min(y + height, self._height)
+
+        for row in range(y, stop):
+            mask = (self._rows[row] >> x) & window
+            start = row * self._width + x
+            while mask:
+                bit = mask & -mask
+                yield start + bit.bit_length() - 1
+                mask ^= bit
+
+    def size(self):
+        """
+        Returns the size of the play field.
+        :return: (columns, rows)
+        """
+
+        return self._width, self._height
+
+    def rows(self):
+        """
+        Returns the row bitmasks, top row first.
+        :return: tuple of ints
+        """
+
+        return tuple(self._rows)
+
+    def colours(self):
+        """
+        Returns the colour of every cell as an index into PALETTE, row by row, 0 where a cell is empty.
+        The buffer is changed in place as the game goes on, never replaced.
+        :return: bytearray
+        """
+
+        return self._colours
+
+    def cells(self):
+        """
+        Returns the occupancy as one byte per cell, row by row, 1 where a cell is taken.
+        The buffer is changed in place as the game goes on, never replaced.
+        :return: the buffer given to the constructor, or the board's own bytearray
+        """
+
+        return self._cells
+
+    def digest(self):
+        """
+        Returns a hash of which cells are taken.
+        :return: 20 byte string
+        """
+
+        return hashlib.sha1(','.join('%x' % mask for mask in self._rows)).digest()
+
+    def reset(self):
+        """
+        Empties the play field.
+        :return:
+        """
+
+        self._rows = [0] * self._height
+        self._colours[:] = bytearray(self._width * self._height)
+        self._tops = [self._height] * self._width
+        self._check = None
+        self._touch(0, self._height)
+        self._cells[:] = bytearray(self._width * self._height)
+
+    def _changed(self, snapshot):
+        """
+        Finds the rows changed since a snapshot was taken.
+        :param snapshot: result of snapshot(), or None
+        :return: list of rows, None if the snapshot isn't of this board
+        """
+
+        if snapshot is None or snapshot[3] is not self._identity:
+            return None
+
+        revision = snapshot[4]
+        return [y for y, changed in enumerate(self._revisions) if changed > revision]
+
+    def snapshot(self, base=None):
+        """
+        Returns the state of the play field.
+        The colour rows that didn't change since the base snapshot are the same strings as in it,
+        so a history of snapshots grows with what changed, not with the board size.
+        :param base: optional earlier snapshot of this board to share the unchanged rows with
+        :return: (row bitmasks tuple, tuple of one colours() string per row, column tops tuple,
+                  board identity, revision)
+        """
+
+        width = self._width
+        colours = self._colours
+
+        changed = self._changed(base)
+        if changed is None:
+            strings = [bytes(colours[y * width:(y + 1) * width]) for y in range(self._height)]
+        else:
+            strings = list(base[1])
+            for y in changed:
+                strings[y] = bytes(colours[y * width:(y + 1) * width])
+
+        return tuple(self._rows), tuple(strings), tuple(self._tops), self._identity, self._revision
+
+    def restore(self, snapshot):
+        """
+        Puts the play field back to a snapshot.
+        Only the rows changed since a snapshot of this board are written, every row for one of another board.
+        :param snapshot: result of snapshot()
+        :return:
+        """
+
+        rows, colours, tops, _, _ = snapshot
+        width = self._width
+
+        changed = self._changed(snapshot)
+        if changed is None:
+            changed = range(self._height)
+
+        # both buffers are written in place, the cells are the colours that aren't empty
+        for y in changed:
+            self._colours[y * width:(y + 1) * width] = colours[y]
+            self._cells[y * width:(y + 1) * width] = bytearray(colours[y].translate(_OCCUPIED))
+
+        self._rows = list(rows)
+        self._tops = list(tops)
+
+        if changed:
+            first, last = changed[0], changed[-1]
+            if self._check is None:
+                self._check = first, last
+            else:
+                self._check = min(self._check[0], first), max(self._check[1], last)
+            self._touch(first, last + 1)
@@ -0,0 +1,305 @@
+import multiprocessing
+import sys
+import time
+
+from blocks import Blocks
+from engine import Engine
+
+# weights of the board features, the placement with the highest sum wins
+WEIGHTS = {
+    'height': -0.510066,
+    'lines': 0.760666,
+    'holes': -0.35663,
+    'bumpiness': -0.184483,
+}
+
+LOST = float('-inf')
+
+
+def fits(rows, width, masks, x, y):
+    """
+    Checks if the row masks can be placed on the rows.
+    :param rows: row bitmasks of the play field
+    :param width: number of columns
+    :param masks: row bitmasks of the shape
+    :param x: column of the left side of the shape
+    :param y: row of the top of the shape
+    :return: boolean
+    """
+    if x < 0 or y < 0 or y + len(masks) > len(rows):
+        return False
+
+    for i, mask in enumerate(masks):
+        mask <<= x
+        if mask >> width or mask & rows[y + i]:
+            return False
+
+    return True
+
+
+def placements(rows, width, shape, rotation, x, y):
+    """
+    Finds every landing spot the shape can reach by rotating, then moving sideways, then falling.
+    :param rows: row bitmasks of the play field
+    :param width: number of columns
+    :param shape: name of the shape
+    :param rotation: current rotation
+    :param x: current column
+    :param y: current row
+    :return: (rotation, x, landing y) tuples
+    """
+    rotations = Blocks._masks[shape]
+
+    for turn in range(len(rotations)):
+
+        # rotate the same way Blocks.rotate does, giving up when it doesn't fit
+        if turn:
+            rotation = (rotation + 1) % len(rotations)
+            x = min(x, width - Blocks._bounds[shape][rotation][0])
+
+            if not fits(rows, width, rotations[rotation], x, y):
+                return
+
+        masks = rotations[rotation]
+
+        # how far it can move each way
+        left = x
+        while fits(rows, width, masks, left - 1, y):
+            left -= 1
+        right = x
+        while fits(rows, width, masks, right + 1, y):
+            right += 1
+
+        for column in range(left, right + 1):
+            landing = y
+            while fits(rows, width, masks, column, landing + 1):
+                landing += 1
+
+            yield rotation, column, landing
+
+
+def evaluate(rows, width, masks, x, y, weights):
+    """
+    Places the shape and scores the resulting play field.
+    :param rows: row bitmasks of the play field
+    :param width: number of columns
+    :param masks: row bitmasks of the shape
+    :param x: column of the shape
+    :param y: landing row of the shape
+    :param weights: feature weights
+    :return: (score, rows after clearing full lines, lines cleared)
+    """
+    rows = list(rows)
+    for i, mask in enumerate(masks):
+        rows[y + i] |= mask << x
+
+    full = (1 << width) - 1
+    kept = [row for row in rows if row != full]
+    lines = len(rows) - len(kept)
+    rows = [0] * lines + kept
+
+    # the play field is full if the shape landed on the top row
+    if y < 1:
+        return LOST, rows, lines
+
+    heights = [0] * width
+    holes = 0
+    seen = 0
+
+    for row_y, row in enumerate(rows):
+        # empty cells with something above them
+        holes += bin(seen & ~row).count('1')
+
+        # columns reached for the first time
+        top = row & ~seen
+        while top:
+            bit = top & -top
+            heights[bit.bit_length() - 1] = len(rows) - row_y
+            top ^= bit
+
+        seen |= row
+
+    bumpiness = sum(abs(heights[i] - heights[i + 1]) for i in range(width - 1))
+
+    score = (weights['height'] * sum(heights) + weights['lines'] * lines +
+             weights['holes'] * holes + weights['bumpiness'] * bumpiness)
+
+    return score, rows, lines
+
+
+def best(rows, width, shape, rotation, x, y, weights):
+    """
+    Finds the best placement of a shape.
+    :return: (score, rotation, x), score is LOST if there is nowhere to go
+    """
+    result = LOST, rotation, x
+
+    for rotation, column, landing in placements(rows, width, shape, rotation, x, y):
+        score, _, _ = evaluate(rows, width, Blocks._masks[shape][rotation], column, landing, weights)
+        if score > result[0] or result[0] == LOST:
+            result = score, rotation, column
+
+    return result
+
+
+def _best_next((rows, width, shape, (x, y), weights)):
+    """
+    Scores the best placement of the next shape, appearing in its start position.
+    Module level so it can run in a worker process.
+    :return: score
+    """
+    x = min(x, width - Blocks._bounds[shape][0][0])
+    if not fits(rows, width, Blocks._masks[shape][0], x, y):
+        return LOST
+
+    score, _, _ = best(rows, width, shape, 0, x, y, weights)
+    return score
+
+
+class Bot:
+    def __init__(self, weights=None, depth=1, processes=0):
+        """
+        Autoplayer that places every shape where the board scores best.
+        :param weights: feature weights, WEIGHTS by default
+        :param depth: 1 to look at the current shape only, 2 to also place the next one
+        :param processes: worker processes to score the next shape in, 0 to score in this one
+        :return:
+        """
+
+        self.weights = WEIGHTS if weights is None else weights
+        self.depth = depth
+
+        self._processes = processes
+        self._pool = multiprocessing.Pool(processes) if processes > 0 else None
+
+        # placement chosen for the current shape
+        self._target = None
+        self._placed = None
+
+    def choose(self, blocks):
+        """
+        Picks where the current shape should go.
+        :param blocks: Blocks with a shape in play
+        :return: (rotation, x) of the top left corner
+        """
+
+        shape, rotation, x, y = blocks.get_piece()
+        board = blocks.get_board()
+        width, _ = board.size()
+        rows = board.rows()
+
+        candidates = []
+        for turned, column, landing in placements(rows, width, shape, rotation, x, y):
+            score, after, lines = evaluate(rows, width, Blocks._masks[shape][turned], column, landing, self.weights)
+            candidates.append((score, after, lines, turned, column))
+
+        if not candidates:
+            return rotation, x
+
+        # look one shape ahead, from the boards each placement leaves behind
+        if self.depth > 1 and blocks.get_piece_next() is not None:
+            jobs = [(after, width, blocks.get_piece_next(), blocks.get_start(), self.weights)
+                    for _, after, _, _, _ in candidates]
+
+            if self._pool is not None:
+                # one chunk per worker, the jobs are too small to send one at a time
+                chunk = -(-len(jobs) // self._processes)
+                ahead = self._pool.map(_best_next, jobs, chunk)
+            else:
+                ahead = [_best_next(job) for job in jobs]
+
+            candidates = [
+                (LOST if score == LOST else next_score + self.weights['lines'] * lines, after, lines, turned, column)
+                for (score, after, lines, turned, column), next_score in zip(candidates, ahead)
+            ]
+
+        score, _, _, turned, column = max(candidates, key=lambda candidate: candidate[0])
+        return turned, column
+
+    def action(self, blocks):
+        """
+        Returns the engine action that brings the current shape closer to its chosen spot.
+        :param blocks: Blocks being played
+        :return: Engine action flags
+        """
+
+        piece = blocks.get_piece()
+        if piece is None:
+            return Engine.NOTHING
+
+        # a new shape came in
+        if self._target is None or self._placed != blocks.placed():
+            self._target = self.choose(blocks)
+            self._placed = blocks.placed()
+
+        _, rotation, x, _ = piece
+        target_rotation, target_x = self._target
+
+        if rotation != target_rotation:
+            return Engine.ROTATE
+        if x < target_x:
+            return Engine.RIGHT
+        if x > target_x:
+            return Engine.LEFT
+
+        return Engine.DROP
+
+    def play(self, engine):
+        """
+        Steps the engine until the current shape has landed.
+        :param engine: Engine being played
+        :return: number of lines cleared
+        """
+
+        placed = engine.pieces
+        lines = engine.lines
+
+        while engine.pieces == placed and not engine.is_over:
+            engine.step(self.action(engine.blocks))
+
+        return engine.lines - lines
+
+    def reset(self):
+        """
+        Forget the chosen placement, for a new game.
+        :return:
+        """
+
+        self._target = None
+        self._placed = None
+
+    def close(self):
+        """
+        Stops the worker processes.
+        :return:
+        """
+
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+
+if __name__ == "__main__":
+    # play a few seeded games headless and report the throughput
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    games = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    bot = Bot(depth=depth, processes=processes)
+    start_time = time.time()
+    pieces = 0
+
+    for seed in range(games):
+        engine = Engine(Blocks((10, 20), (10, 20), (4, 0), seed))
+        bot.reset()
+
+        while not engine.is_over and engine.pieces < 1000:
+            bot.play(engine)
+
+        pieces += engine.pieces
+        print("seed %d: %d lines, %d pieces" % (seed, engine.lines, engine.pieces))
+
+    bot.close()
+
+    seconds = time.time() - start_time
+    print("%d pieces in %.2fs, %.0f pieces/s" % (pieces, seconds, pieces / seconds))
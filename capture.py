@@ -0,0 +1,195 @@
+import mmap
+import struct
+import sys
+import threading
+import time
+
+import numpy
+
+# file layout:
+#   MAGIC, then HEADER: width, height, pitch, bytes per pixel, R, G, B and A masks
+#   a 256 colour RGB palette when there is one byte per pixel
+#   frames of FRAME: frame number, milliseconds since the capture started,
+#   followed by pitch * height bytes of raw pixels
+MAGIC = 'FPBF'
+HEADER = struct.Struct('<IIIIIIII')
+FRAME = struct.Struct('<Id')
+
+
+class Capture:
+    def __init__(self, path, surface, slots=64):
+        """
+        Records the pixels of every frame to a raw file.
+        Frames are copied into a ring buffer in memory, one copy per frame,
+        and written to the file by a background thread.
+        :param path: file to write to
+        :param surface: the surface to capture, the screen
+        :param slots: frames the ring buffer holds, frames are dropped when it is full
+        :return:
+        """
+
+        self._surface = surface
+        self._size = surface.get_pitch() * surface.get_height()
+        self._slots = slots
+
+        # one anonymous mapping for all the slots, with a numpy view to copy into
+        self._map = mmap.mmap(-1, self._size * slots)
+        self._ring = numpy.frombuffer(self._map, numpy.uint8).reshape(slots, self._size)
+
+        # frame number and time of every slot
+        self._frames = [None] * slots
+
+        # frames written to the ring, and taken out of it by the flush thread
+        self._head = 0
+        self._tail = 0
+        self._ready = threading.Condition()
+        self._running = True
+
+        self.captured = 0
+        self.dropped = 0
+        self._start = time.time()
+
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._file.write(HEADER.pack(
+            surface.get_width(), surface.get_height(), surface.get_pitch(), surface.get_bytesize(),
+            *surface.get_masks()
+        ))
+
+        if surface.get_bytesize() == 1:
+            palette = surface.get_palette()
+            self._file.write(''.join(struct.pack('BBB', *colour[:3]) for colour in palette))
+
+        self._thread = threading.Thread(target=self._flush)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def frame(self):
+        """
+        Copies the current pixels of the surface into the ring buffer.
+        :return: boolean, False if the frame was dropped because the file can't keep up
+        """
+
+        number = self.captured + self.dropped
+
+        if self._head - self._tail >= self._slots:
+            self.dropped += 1
+            return False
+
+        slot = self._head % self._slots
+
+        pixels = self._surface.get_buffer()
+        self._ring[slot] = numpy.frombuffer(pixels, numpy.uint8)
+        # let go of the surface lock
+        del pixels
+
+        self._frames[slot] = number, (time.time() - self._start) * 1000
+
+        with self._ready:
+            self._head += 1
+            self._ready.notify()
+
+        self.captured += 1
+        return True
+
+    def _flush(self):
+        """
+        Writes the captured frames to the file until closed, run in a background thread.
+        :return:
+        """
+
+        while True:
+            with self._ready:
+                while self._tail == self._head and self._running:
+                    self._ready.wait()
+
+                if self._tail == self._head:
+                    return
+
+            slot = self._tail % self._slots
+            offset = slot * self._size
+
+            self._file.write(FRAME.pack(*self._frames[slot]))
+            self._file.write(self._map[offset:offset + self._size])
+
+            with self._ready:
+                self._tail += 1
+
+    def close(self):
+        """
+        Writes the frames still in the ring buffer and closes the file.
+        :return:
+        """
+
+        if not self._running:
+            return
+
+        with self._ready:
+            self._running = False
+            self._ready.notify()
+
+        self._thread.join()
+        self._file.close()
+
+        del self._ring
+        self._map.close()
+
+
+def read(path):
+    """
+    Reads the frames of a capture.
+    :param path: file written by a Capture
+    :return: generator of (frame number, milliseconds, RGB numpy array of height x width x 3)
+    """
+
+    with open(path, 'rb') as stream:
+        if stream.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a capture" % path)
+
+        width, height, pitch, depth, red, green, blue, _ = HEADER.unpack(stream.read(HEADER.size))
+
+        palette = None
+        if depth == 1:
+            palette = numpy.frombuffer(stream.read(256 * 3), numpy.uint8).reshape(256, 3)
+
+        size = pitch * height
+        while True:
+            header = stream.read(FRAME.size)
+            pixels = stream.read(size)
+            if len(header) < FRAME.size or len(pixels) < size:
+                return
+
+            number, milliseconds = FRAME.unpack(header)
+            rows = numpy.frombuffer(pixels, numpy.uint8).reshape(height, pitch)[:, :width * depth]
+
+            if palette is not None:
+                rgb = palette[rows]
+            else:
+                # whole little endian pixels, then every channel shifted down by its mask
+                values = numpy.zeros((height, width), numpy.uint32)
+                for byte in range(depth):
+                    values |= rows[:, byte::depth].astype(numpy.uint32) << (8 * byte)
+                rgb = numpy.empty((height, width, 3), numpy.uint8)
+                for channel, mask in enumerate((red, green, blue)):
+                    shift = (mask & -mask).bit_length() - 1
+                    rgb[:, :, channel] = (values & mask) >> shift
+
+            yield number, milliseconds, rgb
+
+
+if __name__ == "__main__":
+    # python capture.py CAPTURE [DIRECTORY] saves every frame as a PNG
+    import os
+    import pygame
+
+    out = sys.argv[2] if len(sys.argv) > 2 else '.'
+    if not os.path.isdir(out):
+        os.makedirs(out)
+
+    count = 0
+    for number, milliseconds, rgb in read(sys.argv[1]):
+        image = pygame.surfarray.make_surface(rgb.swapaxes(0, 1))
+        pygame.image.save(image, os.path.join(out, "frame-%06d.png" % number))
+        count += 1
+
+    print("%d frames saved to %s" % (count, out))
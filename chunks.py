@@ -0,0 +1,121 @@
+from collections import OrderedDict
+
+import pygame
+
+from board import PALETTE
+from sprites import KEY, SpriteCache, blits, unkeyed
+
+
+class Chunks:
+    def __init__(self, cell, sprites=None, size=16, limit=64):
+        """
+        Draws the landed blocks as square chunks of cells, each pre-rendered to a surface.
+        A chunk is only drawn again when one of its rows changed on the board, so the
+        cost of a frame depends on what is visible and what changed, not on the board size.
+        :param cell: (width, height) of a cell in pixels
+        :param sprites: SpriteCache to draw the cells with, a new one by default
+        :param size: cells per side of a chunk
+        :param limit: most chunk surfaces to keep, the least recently used go first
+        :return:
+        """
+
+        self._cell = tuple(cell)
+        self._cell_width, self._cell_height = cell
+        self.size = size
+        self.limit = limit
+        self._sprites = SpriteCache() if sprites is None else sprites
+
+        # (chunk x, chunk y) -> (board revision, surface)
+        self._chunks = OrderedDict()
+
+    def blits(self, board, view, area):
+        """
+        Brings the chunks inside the view up to date, without drawing them.
+        :param board: Board to draw
+        :param view: (x, y, width, height) of the visible cells
+        :param area: pygame.Rect of the play area on screen, the top left visible cell goes in its corner
+        :return: (list of (surface, position, area) to blit, cut to the play area,
+                  list of pygame.Rect of the chunks that were drawn again)
+        """
+
+        x, y, width, height = view
+        columns, rows = board.size()
+        size = self.size
+        sequence = []
+        redrawn = []
+
+        for chunk_y in range(y // size, (min(y + height, rows) - 1) // size + 1):
+            top = chunk_y * size
+            revision = board.revision(top, top + size)
+
+            for chunk_x in range(x // size, (min(x + width, columns) - 1) // size + 1):
+                key = chunk_x, chunk_y
+                left = chunk_x * size
+
+                cached = self._chunks.pop(key, None)
+                if cached is None or cached[0] != revision:
+                    cached = revision, self._render(board, left, top, cached)
+                    dirty = True
+                else:
+                    dirty = False
+
+                # most recently used last
+                self._chunks[key] = cached
+
+                position = (area.left + (left - x) * self._cell_width,
+                            area.top + (top - y) * self._cell_height)
+                rect = area.clip(cached[1].get_rect(topleft=position))
+
+                sequence.append((cached[1], rect.topleft, rect.move(-position[0], -position[1])))
+                if dirty:
+                    redrawn.append(rect)
+
+        while len(self._chunks) > self.limit:
+            self._chunks.popitem(last=False)
+
+        return sequence, redrawn
+
+    def _render(self, board, left, top, cached=None):
+        """
+        Draws the cells of one chunk.
+        :param board: Board to draw
+        :param left: first column of the chunk
+        :param top: first row of the chunk
+        :param cached: the previous (revision, surface) of the chunk, its surface is reused
+        :return: pygame.Surface
+        """
+
+        if cached is not None:
+            surface = cached[1]
+        else:
+            surface = pygame.Surface((self.size * self._cell_width, self.size * self._cell_height)).convert()
+            surface.set_colorkey(KEY)
+
+        surface.fill(KEY)
+
+        # straight from the board's colour plane, one sprite lookup per palette colour
+        colours = board.colours()
+        columns, _ = board.size()
+        sprites = {}
+
+        sequence = []
+        for index in board.occupied(left, top, self.size, self.size):
+            colour = colours[index]
+            sprite = sprites.get(colour)
+            if sprite is None:
+                sprite = sprites[colour] = self._sprites.cell(unkeyed(PALETTE[colour]), self._cell)
+
+            y, x = divmod(index, columns)
+            sequence.append((sprite, ((x - left) * self._cell_width, (y - top) * self._cell_height)))
+
+        blits(surface, sequence)
+
+        return surface
+
+    def clear(self):
+        """
+        Forgets every chunk, for when the cell size changes.
+        :return:
+        """
+
+        self._chunks.clear()
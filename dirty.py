@@ -0,0 +1,87 @@
+import pygame
+
+
+class DirtyRects:
+    def __init__(self):
+        """
+        Tracks which parts of the screen changed since the last frame.
+        :return:
+        """
+
+        # cells drawn in the last frame, (x, y) -> colour
+        self._cells = {}
+
+        # panel name -> state drawn in the last frame
+        self._panels = {}
+
+        self._rects = []
+        self._everything = True
+
+    def cells(self, cells, rect):
+        """
+        Compares the cells of this frame with the previous ones.
+        :param cells: dict of (x, y) -> colour
+        :param rect: function converting (x, y) to a pygame.Rect
+        :return:
+        """
+
+        previous = self._cells
+
+        for cell, colour in cells.iteritems():
+            if previous.get(cell) != colour:
+                self._rects.append(rect(*cell))
+
+        for cell in previous:
+            if cell not in cells:
+                self._rects.append(rect(*cell))
+
+        self._cells = cells
+
+    def panel(self, name, state, rect):
+        """
+        Marks a screen region as changed if its state differs from the previous frame.
+        :param name: panel identifier
+        :param state: anything comparable describing what the panel shows
+        :param rect: the region the panel covers
+        :return:
+        """
+
+        if name not in self._panels or self._panels[name] != state:
+            self._panels[name] = state
+            self._rects.append(pygame.Rect(rect))
+
+    def add(self, rects):
+        """
+        Marks screen regions as changed.
+        :param rects: list of pygame.Rect
+        :return:
+        """
+
+        self._rects.extend(rects)
+
+    def invalidate(self):
+        """
+        Forces the whole screen to be updated on the next frame.
+        :return:
+        """
+
+        self._everything = True
+
+    def update(self):
+        """
+        Pushes the changed regions to the display.
+        :return: number of rects updated, None if the whole screen was
+        """
+
+        if self._everything:
+            self._everything = False
+            self._rects = []
+            pygame.display.flip()
+            return None
+
+        rects = self._rects
+        self._rects = []
+
+        pygame.display.update(rects)
+
+        return len(rects)
@@ -0,0 +1,140 @@
+from blocks import Blocks
+
+
+class Engine:
+    # actions, can be combined with |
+    NOTHING = 0
+    LEFT = 1
+    RIGHT = 2
+    ROTATE = 4
+    DOWN = 8
+    DROP = 16
+
+    def __init__(self, blocks=None, gravity=20, soft_gravity=2):
+        """
+        Game rules without any rendering or real time waits.
+        Every call to step() is one simulation step.
+        :param blocks: Blocks instance to play on, a 10x20 one by default
+        :param gravity: steps between the shape falling one row
+        :param soft_gravity: steps between falling while DOWN is held
+        :return:
+        """
+
+        if blocks is None:
+            blocks = Blocks((10, 20), (10, 20), (4, 0))
+
+        self.blocks = blocks
+        self.gravity = gravity
+        self.soft_gravity = soft_gravity
+
+        self.score = 0
+        self.lines = 0
+        self.steps = 0
+
+        self._fall = 0
+
+    @property
+    def is_over(self):
+        """
+        Returns whether the play field is full.
+        :return: boolean
+        """
+
+        return self.blocks.full()
+
+    @property
+    def pieces(self):
+        """
+        Returns the number of shapes placed so far.
+        :return: int
+        """
+
+        return self.blocks.placed()
+
+    def step(self, action=NOTHING):
+        """
+        Advances the game by one simulation step.
+        :param action: combination of the action flags
+        :return: number of lines cleared in this step
+        """
+
+        blocks = self.blocks
+        if blocks.full():
+            return 0
+
+        self.steps += 1
+
+        # if no shape, make one
+        if not blocks.active():
+            blocks.new()
+            return 0
+
+        # a hard drop lands the shape straight away and ignores the other actions
+        if action & self.DROP:
+            blocks.drop()
+            self._fall = 0
+
+        else:
+            # only a shape landing can fill a line
+            placed = blocks.placed()
+
+            if action & self.ROTATE:
+                blocks.rotate()
+
+            if action & self.LEFT:
+                blocks.move(blocks.MOVE_LEFT)
+            elif action & self.RIGHT:
+                blocks.move(blocks.MOVE_RIGHT)
+            else:
+                blocks.move(None)
+
+            # make the shape fall every few steps
+            self._fall += 1
+            if self._fall >= (self.soft_gravity if action & self.DOWN else self.gravity):
+                blocks.move(blocks.MOVE_DOWN)
+                self._fall = 0
+
+            if blocks.placed() == placed:
+                return 0
+
+        # a point for every full line
+        lines = blocks.line()
+        self.lines += lines
+        self.score += lines
+
+        return lines
+
+    def snapshot(self, base=None):
+        """
+        Returns the state of the game, see Blocks.snapshot().
+        :param base: optional earlier snapshot of this game to share unchanged rows with
+        :return: (Blocks snapshot, score, lines, steps, gravity counter)
+        """
+
+        blocks = self.blocks.snapshot(None if base is None else base[0])
+        return blocks, self.score, self.lines, self.steps, self._fall
+
+    def restore(self, snapshot):
+        """
+        Puts the game back to a snapshot.
+        :param snapshot: result of snapshot()
+        :return:
+        """
+
+        blocks, self.score, self.lines, self.steps, self._fall = snapshot
+        self.blocks.restore(blocks)
+
+    def reset(self, seed=None):
+        """
+        Reset the game.
+        :param seed: optional new seed for the shapes
+        :return:
+        """
+
+        self.blocks.reset(seed)
+
+        self.score = 0
+        self.lines = 0
+        self.steps = 0
+
+        self._fall = 0
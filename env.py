@@ -0,0 +1,275 @@
+import mmap
+import multiprocessing
+import random
+
+import numpy
+
+from blocks import Blocks
+from engine import Engine
+
+
+class Env:
+    # actions are the Engine action flags, every combination of them is one action
+    ACTIONS = 32
+
+    def __init__(self, grid=(10, 20), seed=None, gravity=20, soft_gravity=2, cells=None):
+        """
+        Reinforcement learning environment playing one game under the Engine rules.
+        The observation is a read only numpy view of the board's own cells, 1 where a
+        block landed, and is updated in place by every step rather than built again.
+        The falling shape isn't part of it, info() has where it is.
+        :param grid: (columns, rows) of the play field
+        :param seed: seed of the episode seeds, random if None
+        :param gravity: steps between the shape falling one row
+        :param soft_gravity: steps between falling while DOWN is held
+        :param cells: buffer of columns * rows bytes to keep the board in, see Board
+        :return:
+        """
+
+        width, height = grid
+
+        # every episode gets a seed of its own, drawn from the environment's seed
+        self._seeds = random.Random(seed)
+
+        self.blocks = Blocks(grid, grid, (width / 2 - 1, 0), None, cells)
+        self.engine = Engine(self.blocks, gravity, soft_gravity)
+
+        self.observation = numpy.frombuffer(self.blocks.get_board().cells(), numpy.uint8).reshape(height, width)
+        self.observation.flags.writeable = False
+
+    def reset(self, seed=None):
+        """
+        Starts a new episode, with the first shape already in play.
+        :param seed: seed of the shapes, the next episode seed if None
+        :return: observation
+        """
+
+        if seed is None:
+            seed = self._seeds.getrandbits(32)
+
+        self.engine.reset(seed)
+
+        # the first step of a game only brings in the shape
+        self.engine.step()
+
+        return self.observation
+
+    def step(self, action):
+        """
+        Advances the game by one engine step.
+        :param action: combination of the Engine action flags
+        :return: (observation, lines cleared, whether the game is over, info())
+        """
+
+        if self.engine.is_over:
+            return self.observation, 0, True, self.info()
+
+        lines = self.engine.step(action)
+        return self.observation, lines, self.engine.is_over, self.info()
+
+    def info(self):
+        """
+        Returns what the observation leaves out.
+        :return: dict of the score, lines, placed shapes, engine steps,
+                 the falling shape as (shape, rotation, x, y) or None, and the next shape
+        """
+
+        return {
+            'score': self.engine.score,
+            'lines': self.engine.lines,
+            'pieces': self.engine.pieces,
+            'steps': self.engine.steps,
+            'piece': self.blocks.get_piece(),
+            'next': self.blocks.get_piece_next(),
+        }
+
+
+def _arrays(count, grid, shared):
+    """
+    Lays out the state of a VectorEnv in one buffer.
+    :param count: number of environments
+    :param grid: (columns, rows) of every play field
+    :param shared: whether the buffer is shared with worker processes
+    :return: (observations, actions, rewards, dones, scores, pieces) numpy arrays
+    """
+    width, height = grid
+    layout = (
+        ((count, height, width), numpy.uint8),
+        ((count,), numpy.uint8),
+        ((count,), numpy.int32),
+        ((count,), numpy.bool_),
+        ((count,), numpy.int64),
+        ((count,), numpy.int64),
+    )
+
+    # every array starts on an 8 byte boundary
+    offsets = []
+    size = 0
+    for shape, dtype in layout:
+        offsets.append(size)
+        size += (int(numpy.prod(shape)) * numpy.dtype(dtype).itemsize + 7) // 8 * 8
+
+    # an anonymous mapping stays shared with the processes forked after it is made
+    buffer = mmap.mmap(-1, size) if shared else bytearray(size)
+
+    return tuple(
+        numpy.frombuffer(buffer, dtype, int(numpy.prod(shape)), offset).reshape(shape)
+        for (shape, dtype), offset in zip(layout, offsets)
+    )
+
+
+def _step(envs, start, actions, rewards, dones, scores, pieces):
+    """
+    Steps environments, starting the ones that finished over again.
+    :param envs: Env instances
+    :param start: index of the first of them in the arrays
+    :return:
+    """
+
+    if not envs:
+        return
+
+    stop = start + len(envs)
+
+    # plain ints in and out, one numpy copy per array rather than one per environment
+    steps = []
+    for env, action in zip(envs, actions[start:stop].tolist()):
+        engine = env.engine
+        lines = engine.step(action)
+        steps.append((lines, engine.is_over, engine.score, engine.pieces))
+
+        if engine.is_over:
+            env.reset()
+
+    rewards[start:stop], dones[start:stop], scores[start:stop], pieces[start:stop] = zip(*steps)
+
+
+def _work(connection, envs, start, arrays):
+    """
+    Runs environments in a worker process until told to stop.
+    :param connection: end of the pipe to the VectorEnv
+    :param envs: Env instances on the shared buffer
+    :param start: index of the first of them in the arrays
+    :param arrays: the shared arrays, see _arrays()
+    :return:
+    """
+
+    observations, actions, rewards, dones, scores, pieces = arrays
+
+    while True:
+        command = connection.recv()
+
+        if command == 'step':
+            _step(envs, start, actions, rewards, dones, scores, pieces)
+        elif command == 'reset':
+            for env in envs:
+                env.reset()
+        else:
+            break
+
+        connection.send(None)
+
+
+class VectorEnv:
+    def __init__(self, count, grid=(10, 20), seed=None, gravity=20, soft_gravity=2, workers=0):
+        """
+        Steps many environments at once. The boards of all of them write straight into
+        one (count, rows, columns) array, which is the observation, and the rewards,
+        ends of episodes and scores are arrays updated in place too. Finished games
+        start over within the step that ended them.
+        With workers, the environments are split between worker processes that share
+        those arrays with this one, only a short message goes through a pipe per step.
+        :param count: number of environments
+        :param grid: (columns, rows) of every play field
+        :param seed: seed of the environment seeds, random if None
+        :param gravity: steps between the shapes falling one row
+        :param soft_gravity: steps between falling while DOWN is held
+        :param workers: number of worker processes, 0 to step everything in this process
+        :return:
+        """
+
+        self.count = count
+        self._arrays = _arrays(count, grid, workers > 0)
+        boards, self._actions, self.rewards, self.dones, self.scores, self.pieces = self._arrays
+
+        # the boards write to the array, callers only get to read it
+        self.observations = boards.view()
+        self.observations.flags.writeable = False
+
+        width, height = grid
+        seeds = random.Random(seed)
+        self._envs = [
+            Env(grid, seeds.getrandbits(32), gravity, soft_gravity, boards[i].reshape(width * height))
+            for i in range(count)
+        ]
+
+        # contiguous slices of the environments, forked with the shared buffer;
+        # no more workers than environments, so none of them gets an empty slice
+        workers = min(workers, count)
+        self._workers = []
+        for worker in range(workers):
+            start = count * worker // workers
+            stop = count * (worker + 1) // workers
+
+            connection, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_work, args=(child, self._envs[start:stop], start, self._arrays))
+            process.daemon = True
+            process.start()
+
+            self._workers.append((process, connection))
+
+    def _run(self, command):
+        """
+        Has every worker carry out a command and waits for them.
+        :param command: 'step' or 'reset'
+        :return:
+        """
+
+        for _, connection in self._workers:
+            connection.send(command)
+        for _, connection in self._workers:
+            connection.recv()
+
+    def reset(self):
+        """
+        Starts a new episode in every environment.
+        :return: observations
+        """
+
+        if self._workers:
+            self._run('reset')
+        else:
+            for env in self._envs:
+                env.reset()
+
+        return self.observations
+
+    def step(self, actions):
+        """
+        Advances every environment by one engine step.
+        The returned arrays are the same every time, overwritten by the next step.
+        :param actions: Engine action flags, one per environment or one for all
+        :return: (observations, lines cleared, whether each game ended, {'score': ..., 'pieces': ...}),
+                 the score and pieces of an ended game are its final ones
+        """
+
+        self._actions[:] = actions
+
+        if self._workers:
+            self._run('step')
+        else:
+            _step(self._envs, 0, self._actions, self.rewards, self.dones, self.scores, self.pieces)
+
+        return self.observations, self.rewards, self.dones, {'score': self.scores, 'pieces': self.pieces}
+
+    def close(self):
+        """
+        Stops the worker processes.
+        :return:
+        """
+
+        for process, connection in self._workers:
+            connection.send(None)
+            process.join()
+
+        self._workers = []
@@ -1,39 +1,114 @@
 import pygame
+import random
 import sys
+import threading
 import time
-import webbrowser
 
 import os
 
 os.environ['SDL_VIDEO_CENTERED'] = '1'
 
 from blocks import Blocks
+from chunks import Chunks
+from sprites import SpriteCache, blits
+from engine import Engine
+from dirty import DirtyRects
+from history import History
+from inputs import AutoShift
+from leaderboard import Leaderboard
+from profiler import Profiler
+from replay import Recorder
+from text import TextCache
 
 GRID_ENABLED = True
 
+# columns and rows of the play field
+GRID = 10, 20
+
+# smallest cell in pixels, bigger play fields scroll to follow the shape
+MIN_CELL = 8
+
+# push only the changed screen regions instead of flipping the whole window
+DIRTY_RECTS = False
+
+# CSV file to stream the time of every frame phase to, None to disable
+PROFILE = None
+
+# F9 records the frames shown to this directory, see capture.py
+CAPTURES = "captures"
+
+# high scores are kept in this file, None to forget them on exit
+LEADERBOARD = "scores.db"
+
+# every game is recorded to this directory, None to disable
+REPLAYS = "replays"
+
+# posted by the mixer when the music stops
+MUSIC_END = pygame.USEREVENT
+
+# posted once the music has loaded in the background
+MUSIC_READY = pygame.USEREVENT + 1
+
 
 class Game:
-    def __init__(self):
+    def __init__(self, grid=GRID):
         """
         Falling PyBlocks, a clone of Tetris.
+        :param grid: (columns, rows) of the play field
         :return:
         """
-        pygame.mixer.pre_init(44100, -16, 2, 2048)
-        pygame.init()
-
-        # sound file downloaded from (https://archive.org/details/TetrisThemeMusic)
-        pygame.mixer.music.load('tetris.ogg')
+        # only what the first frame needs, the mixer starts in the background
+        pygame.display.init()
+        pygame.font.init()
+
+        # queue only the events that are handled
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed([
+            pygame.QUIT, pygame.KEYDOWN, pygame.KEYUP, pygame.MOUSEBUTTONDOWN, MUSIC_END, MUSIC_READY
+        ])
+
+        self.music_on = True
+        self.music_ready = threading.Event()
+        self._music_loader = threading.Thread(target=self.load_music)
+        self._music_loader.daemon = True
+        self._music_loader.start()
 
         # grid divider
-        self.grid_x = 10
-        self.grid_y = 20
+        self.grid_x, self.grid_y = grid
 
-        # game speed
+        # where new shapes appear, in the middle of the top row
+        self.start = self.grid_x / 2 - 1, 0
+
+        # game speed, seconds per row normally and while dropping
         self.game_speed = 0.5
+        self.drop_speed = 0.05
         self.fps = 30
 
+        # simulation step in milliseconds, and the most steps to catch up in one frame
+        self.step_time = 25
+        self.max_steps = 5
+        self.clock = pygame.time.Clock()
+
+        # milliseconds before a held left or right key repeats, and between repeats
+        self.shift_delay = 150
+        self.shift_rate = 50
+
         # game status
         self.over = False
+        self.paused = False
+
+        # input, as engine actions
+        self.shift = AutoShift(self.shift_delay, self.shift_rate)
+        self.soft_drop = False
+        self.hard_drop = False
+        self.rotate = False
+
+        # autoplayer, takes over the input while enabled; made the first time it is
+        self.bot = None
+        self.autoplay = False
+
+        # whether the autoplayer played any of the current game, which keeps it off the leaderboard
+        self.autoplayed = False
 
         # colours
         self.colour_clear = (25,) * 3
@@ -48,8 +123,20 @@ class Game:
         self.display_height = 440
 
         # grid box sizes
-        self.grid_real_x = self.display_width / self.grid_x
-        self.grid_real_y = self.display_height / self.grid_y
+        self.grid_real_x = max(self.display_width / self.grid_x, MIN_CELL)
+        self.grid_real_y = max(self.display_height / self.grid_y, MIN_CELL)
+
+        # the part of the grid on screen, as the top left cell and number of cells
+        self.view_x = 0
+        self.view_y = 0
+        self.view_width = min(self.grid_x, self.display_width / self.grid_real_x)
+        self.view_height = min(self.grid_y, self.display_height / self.grid_real_y)
+
+        # pre-rendered cells, of the play field and the next shape panel
+        self.sprites = SpriteCache()
+
+        # landed blocks, pre-rendered in chunks
+        self.chunks = Chunks((self.grid_real_x, self.grid_real_y), self.sprites)
 
         # score text box sizes
         self.score_width = 100
@@ -60,118 +147,306 @@ class Game:
 
         self.screen = pygame.display.set_mode((self.window_width, self.window_height))
 
+        # pre-rendered static layer, see self.background()
+        self.grid_enabled = GRID_ENABLED
+        self._background = None
+        self._background_key = None
+        self.creator = None
+
+        # changed screen regions, used when self.dirty_rects is enabled
+        self.dirty_rects = DIRTY_RECTS
+        self.dirty = DirtyRects()
+
+        # seed of the current game, and where its inputs are recorded
+        self.seed = random.getrandbits(32)
+        self.replay = None
+
+        # state at the start of the last shapes, for undo
+        self.history = History(50)
+        self._history_piece = None
+
+        # the other player's side, see self.play_versus(), and its pre-rendered panel
+        self.versus = None
+        self._opponent = None
+        self._opponent_key = None
+        self._opponent_field = None
+        self._opponent_rows = None
+
+        # frame recording, see self.toggle_capture()
+        self.capture = None
+
         self.blocks = Blocks(
             (self.grid_x, self.grid_y),
             (self.display_width, self.display_height),
-            (4, 0)
+            self.start,
+            self.seed
         )
 
-        self.top_players = []
+        # game rules, stepped once per simulation step
+        self.engine = Engine(
+            self.blocks,
+            int(self.game_speed * 1000 / self.step_time),
+            int(self.drop_speed * 1000 / self.step_time)
+        )
+
+        # best scores, only the top 5 are loaded
+        self.leaderboard = Leaderboard(':memory:' if LEADERBOARD is None else LEADERBOARD, 5)
+        self.top_players = self.leaderboard.top()
+
+        # rendered text
+        self.text = TextCache()
+
+        # frame phase timings, shown with F3
+        self.profiler = Profiler(
+            ('wait', 'input', 'update', 'background', 'text', 'blocks', 'hud', 'display', 'capture'),
+            path=PROFILE
+        )
 
     def loop(self):
         """
         Main game loop.
+        Gravity and movement run in fixed simulation steps, drawing happens once per frame.
         :return: main game loop
         """
-        shape_current = None
-        direction = None
-        start_time = time.time()
-        move_time = 0
-        paused = False
-        music_on = True
-        creator = None
-
-        while True:
-
-            if music_on is True:
-                if not pygame.mixer.music.get_busy():
-                    pygame.mixer.music.play()
-
-            while paused is True:
+        lag = 0
+        self.record()
 
-                for event in pygame.event.get():
+        # if the music isn't ready yet it starts on MUSIC_READY
+        self.play_music()
 
-                    # exit if X is pressed
-                    if event.type == pygame.QUIT:
-                        sys.exit()
-
-                    if event.type == pygame.KEYDOWN:
-
-                        if event.key == pygame.K_ESCAPE:
-                            sys.exit()
+        while True:
+            self.profiler.frame()
 
-                        if event.key == pygame.K_p or event.key == pygame.K_r:
-                            paused = False
+            # nothing moves while paused or over, sleep until something happens;
+            # a versus game keeps going to keep the network going, at the frame rate
+            if (self.paused is True or self.over is True) and self.versus is None:
+                self.handle(pygame.event.wait())
+                self.clock.tick()
+                lag = 0
 
             # fps
-            pygame.time.Clock().tick(self.fps)
-
-            # clear screen
-            self.screen.fill(self.colour_clear)
+            lag += self.clock.tick(self.fps)
+            self.profiler.mark('wait')
 
             for event in pygame.event.get():
+                self.handle(event)
 
-                # exit if window X is pressed
-                if event.type == pygame.QUIT:
-                    sys.exit()
+            if self.versus is not None:
+                self.versus.poll()
+            self.profiler.mark('input')
 
-                if event.type == pygame.KEYDOWN:
+            # nothing moves while paused or over, and that time isn't caught up on later
+            if self.paused is True or self.over is True:
+                lag = 0
 
-                    if event.key == pygame.K_ESCAPE:
-                        sys.exit()
+            # catch up with the time passed, skipping steps if the frame took too long
+            steps, lag = divmod(lag, self.step_time)
+            for _ in range(min(steps, self.max_steps)):
+                self.update()
+            self.profiler.mark('update')
 
-                    # key presses listener
-                    if event.key == pygame.K_SPACE or event.key == pygame.K_DOWN or event.key == pygame.K_s:
-                        self.game_speed = 0.05
-                    if event.key == pygame.K_RIGHT or event.key == pygame.K_d:
-                        move_time = time.time()
-                        direction = self.blocks.MOVE_RIGHT
-                    if event.key == pygame.K_LEFT or event.key == pygame.K_a:
-                        move_time = time.time()
-                        direction = self.blocks.MOVE_LEFT
-                    if event.key == pygame.K_UP or event.key == pygame.K_w:
-                        # rotate the block shape clockwise
-                        self.blocks.rotate()
-
-                    if event.key == pygame.K_m:
-                        if pygame.mixer.music.get_busy():
-                            pygame.mixer.music.stop()
-                            music_on = False
-                        else:
-                            pygame.mixer.music.play()
-                            music_on = True
+            self.render()
 
-                    if event.key == pygame.K_r:
-                        self.reset()
-                        self.blocks.reset()
+    def handle(self, event):
+        """
+        Reacts to a single event.
+        :param event: pygame event
+        :return:
+        """
 
-                    if event.key == pygame.K_p:
-                        paused = True
+        # exit if window X is pressed
+        if event.type == pygame.QUIT:
+            sys.exit()
+
+        # keep the music looping
+        if event.type in (MUSIC_END, MUSIC_READY):
+            self.play_music()
+
+        if event.type == pygame.KEYDOWN:
+
+            if event.key == pygame.K_ESCAPE:
+                sys.exit()
+
+            if self.paused is True:
+                if event.key == pygame.K_p or event.key == pygame.K_r:
+                    self.paused = False
+                return
+
+            # key presses listener
+            if event.key == pygame.K_DOWN or event.key == pygame.K_s:
+                self.soft_drop = True
+            if event.key == pygame.K_SPACE:
+                # drop the shape to its landing spot on the next step
+                self.hard_drop = True
+            if event.key == pygame.K_RIGHT or event.key == pygame.K_d:
+                self.shift.press(Engine.RIGHT)
+            if event.key == pygame.K_LEFT or event.key == pygame.K_a:
+                self.shift.press(Engine.LEFT)
+            if event.key == pygame.K_UP or event.key == pygame.K_w:
+                # rotate the block shape clockwise on the next step
+                self.rotate = True
+
+            if event.key == pygame.K_m:
+                self.music_on = not self.music_on
+                if self.music_on is True:
+                    self.play_music()
+                elif self.music_ready.is_set():
+                    pygame.mixer.music.stop()
+
+            if event.key == pygame.K_r:
+                self.reset()
+
+            if event.key == pygame.K_p:
+                self.paused = True
+
+            if event.key == pygame.K_z:
+                self.undo()
+
+            if event.key == pygame.K_g:
+                self.grid_enabled = not self.grid_enabled
+
+            if event.key == pygame.K_b:
+                self.toggle_autoplay()
+
+            if event.key == pygame.K_F3:
+                self.profiler.hud = not self.profiler.hud
+
+            if event.key == pygame.K_F9:
+                self.toggle_capture()
+
+        # released keys stop dropping or shifting
+        if event.type == pygame.KEYUP:
+            if event.key == pygame.K_DOWN or event.key == pygame.K_s:
+                self.soft_drop = False
+            if event.key == pygame.K_RIGHT or event.key == pygame.K_d:
+                self.shift.release(Engine.RIGHT)
+            if event.key == pygame.K_LEFT or event.key == pygame.K_a:
+                self.shift.release(Engine.LEFT)
+
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            mouse_pos = pygame.mouse.get_pos()
+
+            if self.creator is not None and self.creator.collidepoint(mouse_pos):
+                self.open_creator()
+
+    def load_music(self):
+        """
+        Starts the mixer and loads the music, run in a background thread.
+        :return:
+        """
+        try:
+            pygame.mixer.init(44100, -16, 2, 2048)
 
-                # if any key released set the game speed to normal
-                if event.type == pygame.KEYUP:
-                    self.game_speed = 0.5
-                    direction = None
+            # sound file downloaded from (https://archive.org/details/TetrisThemeMusic)
+            pygame.mixer.music.load('tetris.ogg')
+            pygame.mixer.music.set_endevent(MUSIC_END)
+        except pygame.error:
+            # no sound device, play without music
+            return
 
-                if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                    mouse_pos = pygame.mouse.get_pos()
+        self.music_ready.set()
+        pygame.event.post(pygame.event.Event(MUSIC_READY))
 
-                    if creator.collidepoint(mouse_pos):
-                        webbrowser.open("https://github.com/edkotkas")
+    def play_music(self):
+        """
+        Plays the music if it is on, loaded and not already playing.
+        :return:
+        """
+        if self.music_on is True and self.music_ready.is_set() and not pygame.mixer.music.get_busy():
+            pygame.mixer.music.play()
 
-            # play area background
-            pygame.draw.rect(self.screen, (22,) * 3, (0, 0, self.display_width, self.display_height))
+    @staticmethod
+    def open_creator():
+        """
+        Opens the creators GitHub page.
+        :return:
+        """
+        # only needed on a click, so not imported with the game
+        import webbrowser
+        webbrowser.open("https://github.com/edkotkas")
+
+    def update(self):
+        """
+        Advances the game by one simulation step.
+        :return:
+        """
 
-            # side panel background
-            pygame.draw.rect(self.screen, (20,) * 3, (
-                self.display_width, 0,
-                self.window_width - self.display_width, self.window_height))
+        if self.engine.is_over:
+            if self.over is False:
+                self.get_player()
+                if self.replay is not None:
+                    self.replay.close(self.blocks)
+                if self.versus is not None:
+                    self.versus.over()
+                    self.versus.poll()
+            self.over = True
+            return
+
+        if self.autoplay is True:
+            self.autoplayed = True
+            action = self.bot.action(self.blocks)
+        else:
+            action = self.shift.step(self.step_time)
+            if self.soft_drop is True:
+                action |= Engine.DOWN
+            if self.rotate is True:
+                action |= Engine.ROTATE
+                self.rotate = False
+            if self.hard_drop is True:
+                action |= Engine.DROP
+                self.hard_drop = False
+
+        if self.replay is not None:
+            self.replay.step(action)
+
+        lines = self.engine.step(action)
+        self.score = self.engine.score
+
+        if self.versus is not None:
+            self.versus.input(action)
+            self.versus.cleared(lines)
+
+        # remember the start of every new shape
+        if self.blocks.active() and self.engine.pieces != self._history_piece:
+            self.history.push(self.engine.snapshot(self.history.latest()))
+            self._history_piece = self.engine.pieces
+
+    def undo(self):
+        """
+        Takes back the last placed shape.
+        :return:
+        """
+        # no taking back what the opponent has already seen
+        if self.over is True or self.versus is not None:
+            return
+
+        snapshot = self.history.undo()
+        if snapshot is None:
+            return
+
+        self.engine.restore(snapshot)
+        self.score = self.engine.score
+        self._history_piece = self.engine.pieces
+        if self.bot is not None:
+            self.bot.reset()
+
+        # the recorded actions can't reproduce this game anymore
+        if self.replay is not None:
+            self.replay.abandon()
+            self.replay = None
+
+    def render(self):
+        """
+        Draws the current state of the game and updates the screen.
+        :return:
+        """
 
-            # next shape panel
-            self.screen.blit(self.make_text("Next Shape:", 16, font="arial"), (self.display_width + 5, 10))
+        # clear screen with the static layer
+        self.screen.blit(self.background(), (0, 0))
+        self.profiler.mark('background')
 
-            # top players panel
-            self.screen.blit(self.make_text("Top 5:", 20, font="arial"), (self.display_width + 5, 180))
+        # top players panel, the opponent takes its place in a versus game
+        if self.versus is None:
             for i, (score, player) in enumerate(self.top_players):
                 multiplier = 20 * i
                 count = i + 1
@@ -179,128 +454,408 @@ class Game:
                 self.screen.blit(self.make_text("%d.%s - %d" % (count, player, score)),
                                  (self.display_width + 10, 220 + multiplier))
 
-            # controls texts
-            self.screen.blit(self.make_text("Controls:", font="arial"), (self.display_width + 5, 335))
-            self.screen.blit(self.make_text("Arrows - move", font="arial"), (self.display_width + 5, 355))
-            self.screen.blit(self.make_text("M - music off/on", font="arial"), (self.display_width + 5, 375))
-            self.screen.blit(self.make_text("R - reset", font="arial"), (self.display_width + 5, 395))
-            self.screen.blit(self.make_text("P - pause", font="arial"), (self.display_width + 5, 415))
+        self.screen.blit(self.make_text("SCORE: %d" % self.score, 18, font="arial"), (self.display_width + 5, 140))
+        self.profiler.mark('text')
 
-            # the score text
-            pygame.draw.rect(self.screen, (20,) * 3, (
-                0, self.display_height,
-                self.display_width, self.window_height - self.display_width))
+        # scroll to the shape, everything in the play area moves if the view does
+        if self.follow() and self.dirty_rects is True:
+            self.dirty.invalidate()
 
-            creator = self.screen.blit(
-                self.make_text("Falling PyBlocks by Eduard Kotkas (GitHub - @edkotkas)",
-                               colour=(255,) * 3
-                               ), (5, self.window_height - 18))
+        # the block collection, only the chunks in view and cut to the play area
+        batch, redrawn = self.chunks.blits(
+            self.blocks.get_board(),
+            (self.view_x, self.view_y, self.view_width, self.view_height),
+            pygame.Rect(0, 0, self.display_width, self.display_height)
+        )
 
-            self.screen.blit(self.make_text("SCORE: %d" % self.score, 18, font="arial"), (self.display_width + 5, 140))
+        # moving cells drawn this frame
+        drawn = {}
+        cell = self.grid_real_x, self.grid_real_y
+
+        if not self.over:
+
+            # outline where the shape would land, under the shape itself
+            for shape, colour in self.blocks.get_ghost():
+                if self.visible(*shape):
+                    drawn[shape] = (colour, 'ghost')
+                    batch.append((self.sprites.outline(colour, cell), self.pixel(*shape)))
+
+            # the block shape, with the grid coordinates converted to pixel locations
+            for shape, colour in self.blocks.get_shape():
+                if self.visible(*shape):
+                    drawn[shape] = colour
+                    batch.append((self.sprites.cell(colour, cell), self.pixel(*shape)))
+
+        # display the next shape on the panel
+        self.next_shape_panel(batch)
+
+        if self.versus is not None:
+            self.opponent_panel(batch)
+
+        # every cell of the frame in one go
+        blits(self.screen, batch)
+        self.profiler.mark('blocks')
+
+        if self.over:
+            self.screen.blit(self.make_text("GAME OVER", 32, (255,) * 3, font="arial"),
+                             ((self.display_width / 2) - 96, self.display_height / 2))
+        elif self.versus is not None and self.versus.opponent_over:
+            self.screen.blit(self.make_text("YOU WIN", 32, (255,) * 3, font="arial"),
+                             ((self.display_width / 2) - 80, self.display_height / 2))
+
+        if self.paused is True:
+            self.screen.blit(self.make_text("PAUSED", 32, (255,) * 3, font="arial"),
+                             ((self.display_width / 2) - 64, self.display_height / 2))
+        self.profiler.mark('text')
+
+        summary = None
+        if self.profiler.hud is True:
+            summary = self.profiler.summary()
+            self.hud(summary)
+        self.profiler.mark('hud')
+
+        # update screen
+        if self.dirty_rects is True:
+            self.dirty.cells(drawn, self.cell_rect)
+            self.dirty.add(redrawn)
+
+            side_x = self.display_width
+            side_width = self.window_width - self.display_width
+
+            self.dirty.panel("next", tuple(self.blocks.get_shape_next()), (side_x, 30, side_width, 110))
+            self.dirty.panel("score", self.score, (side_x, 140, side_width, 25))
+            if self.versus is not None:
+                self.dirty.panel("top", (tuple(self.versus.opponent_rows), self.versus_stats()),
+                                 (side_x, 180, side_width, 140))
+            else:
+                self.dirty.panel("top", self.top_players, (
+                    side_x, 215, side_width, 20 * len(self.top_players) + 5))
+            self.dirty.panel("overlay", (self.over, self.paused, self.versus is not None and self.versus.opponent_over),
+                             (0, 0, self.display_width, self.display_height))
+            self.dirty.panel("hud", summary, (side_x, 205, side_width, 110))
+
+            self.dirty.update()
+        else:
+            pygame.display.flip()
+        self.profiler.mark('display')
 
-            if GRID_ENABLED is True:
-                self.grid()
+        if self.capture is not None:
+            self.capture.frame()
+        self.profiler.mark('capture')
 
-            # if no shape, make one
-            if shape_current is None:
-                self.blocks.new()
-                shape_current = self.blocks.get_shape()
+    def toggle_autoplay(self):
+        """
+        Hands the input to the autoplayer, or takes it back.
+        :return:
+        """
+        # imports multiprocessing, so only imported when used
+        if self.bot is None:
+            from bot import Bot
+            self.bot = Bot()
 
-            elif not self.blocks.full():
+        self.autoplay = not self.autoplay
+        self.bot.reset()
 
-                if time.time() - move_time > 0.025:
-                    self.blocks.move(direction)
+    def toggle_capture(self):
+        """
+        Starts or stops recording the frames shown to the captures directory.
+        :return:
+        """
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+            return
 
-                # make the blocks fall after a fraction of a second
-                if time.time() - start_time > self.game_speed:
-                    self.blocks.move(self.blocks.MOVE_DOWN)
-                    start_time = time.time()
+        # needs numpy, so only imported when used
+        from capture import Capture
 
-                # render the block shape to the screen
-                for shape, colour in self.blocks.get_shape():
-                    # convert the grid coordinates to pixel location
-                    shape_x, shape_y = self.pixel(*shape)
+        if not os.path.isdir(CAPTURES):
+            os.makedirs(CAPTURES)
 
-                    pygame.draw.rect(self.screen, colour, (
-                        shape_x, shape_y,
-                        self.grid_real_x, self.grid_real_y))
+        self.capture = Capture(
+            os.path.join(CAPTURES, "%s-%08x.fpbf" % (time.strftime("%Y%m%d-%H%M%S"), self.seed)),
+            self.screen
+        )
 
-                    pygame.draw.rect(self.screen, (50,) * 3, (
-                        shape_x, shape_y,
-                        self.grid_real_x, self.grid_real_y), 3)
+    def opponent_panel(self, batch):
+        """
+        Displays a small copy of the opponent's play field and the connection stats,
+        in place of the top players. The panel is one surface, only drawn again when
+        the opponent's board or the stats changed.
+        :param batch: list of (surface, position) drawn this frame, the panel is added to it
+        """
+        key = tuple(self.versus.opponent_rows), self.versus_stats()
 
-            else:
-                if self.over is False:
-                    self.get_player()
-                self.over = True
+        if self._opponent is None or self._opponent_key != key:
+            self._opponent = self.draw_opponent_panel(*key)
+            self._opponent_key = key
 
-            # display the next shape on the panel
-            self.next_shape_panel()
+        batch.append((self._opponent, (self.display_width, 180)))
 
-            # render the block collection
-            the_blocks = [shape for shape in self.blocks.display()]
+    def draw_opponent_panel(self, rows, stats):
+        """
+        Draws the opponent panel, the size of the top players panel so nothing spills out of it.
+        :param rows: the opponent's row bitmasks
+        :param stats: lines of text, see self.versus_stats()
+        :return: pygame.Surface
+        """
+        width, height = self.window_width - self.display_width, 140
 
-            if len(the_blocks) > 0:
-                for shape, colour in the_blocks:
-                    block_x, block_y = self.pixel(*shape)
+        # opaque, covers the top players title
+        surface = pygame.Surface((width, height)).convert()
+        surface.fill(self.colour_clear)
+        surface.blit(self.make_text("Opponent:", 20, font="arial"), (5, 0))
 
-                    pygame.draw.rect(self.screen, colour, (
-                        block_x, block_y,
-                        self.grid_real_x, self.grid_real_y))
+        # the play field goes in the left half under the title, up to 5 pixels a cell
+        box_width, box_height = width / 2 - 7, height - 32
+        cell = max(1, min(5, box_height / self.grid_y, box_width / self.grid_x))
 
-                    pygame.draw.rect(self.screen, (50,) * 3, (
-                        block_x, block_y,
-                        self.grid_real_x, self.grid_real_y), 3)
+        field = self.opponent_field(rows, cell)
 
-            # if the bottom line is full, add score
-            if self.blocks.line():
-                self.score += 1
+        # big play fields are shrunk to fit, even at a pixel a cell they wouldn't
+        field_width, field_height = field.get_size()
+        if field_width > box_width or field_height > box_height:
+            scale = min(float(box_width) / field_width, float(box_height) / field_height)
+            field_width, field_height = max(1, int(field_width * scale)), max(1, int(field_height * scale))
+            field = pygame.transform.scale(field, (field_width, field_height))
 
-            if self.over:
-                self.screen.blit(self.make_text("GAME OVER", 32, (255,) * 3, font="arial"),
-                                 ((self.display_width / 2) - 96, self.display_height / 2))
+        surface.blit(field, (6, 26))
+        pygame.draw.rect(surface, self.colour_grid, (5, 25, field_width + 2, field_height + 2), 1)
 
-            if paused is True:
-                self.screen.blit(self.make_text("PAUSED", 32, (255,) * 3, font="arial"),
-                                 ((self.display_width / 2) - 64, self.display_height / 2))
+        for i, line in enumerate(stats):
+            surface.blit(self.make_text(line, 12), (field_width + 12, 25 + 16 * i))
 
-            # update screen
-            pygame.display.flip()
+        return surface
+
+    def opponent_field(self, rows, cell):
+        """
+        Returns the opponent's play field drawn at a cell size, kept between calls
+        so only the rows that changed since the last one are drawn again.
+        :param rows: the opponent's row bitmasks
+        :param cell: pixels per side of a cell
+        :return: pygame.Surface
+        """
+        size = self.grid_x * cell, self.grid_y * cell
+
+        if self._opponent_field is None or self._opponent_field.get_size() != size:
+            self._opponent_field = pygame.Surface(size).convert()
+            self._opponent_field.fill(self.colour_clear)
+            self._opponent_rows = [0] * len(rows)
+
+        field = self._opponent_field
+        for y, row in enumerate(rows):
+            if row == self._opponent_rows[y]:
+                continue
+
+            self._opponent_rows[y] = row
+            field.fill(self.colour_clear, (0, y * cell, size[0], cell))
+
+            # one fill per run of taken cells
+            x = 0
+            while row:
+                gap = (row & -row).bit_length() - 1
+                row >>= gap
+                x += gap
+
+                run = (~row & (row + 1)).bit_length() - 1
+                field.fill((200,) * 3, (x * cell, y * cell, run * cell, cell))
+                row >>= run
+                x += run
+
+        return field
+
+    def versus_stats(self):
+        """
+        Returns the connection stats as lines of text.
+        :return: tuple of strings
+        """
+        sent, received, p50, _ = self.versus.stats()
+        lines = ("up %dB/s" % sent, "down %dB/s" % received,
+                 "rtt %s" % ("-" if p50 is None else "%dms" % p50))
+
+        if self.versus.closed:
+            lines += ("offline",)
+
+        return lines
+
+    def play_versus(self, address):
+        """
+        Connects to the other player, see versus.connect().
+        Versus games can't be replayed from the inputs alone, so they aren't recorded.
+        :param address: 'host:port' to join, ':port' to host
+        :return:
+        """
+        # only needed with an address given, so only imported then
+        from versus import Versus, connect
+
+        self.versus = Versus(connect(address), self.blocks)
+
+    def hud(self, summary):
+        """
+        Displays the frame timings over the top players panel.
+        :param summary: result of Profiler.summary()
+        :return:
+        """
+        if summary is None:
+            return
+
+        fps, p50, p99, phases = summary
+
+        pygame.draw.rect(self.screen, (10,) * 3, (
+            self.display_width, 205,
+            self.window_width - self.display_width, 110))
+
+        lines = ["FPS %.1f" % fps, "p50 %.2fms" % p50, "p99 %.2fms" % p99]
+        lines += ["%-10s%.2f" % (name, spent) for name, spent in phases]
+
+        for i, line in enumerate(lines):
+            self.screen.blit(self.make_text(line, 12, (120, 220, 120)), (self.display_width + 5, 210 + 16 * i))
 
-    def next_shape_panel(self):
+    def next_shape_panel(self, batch):
         """
         Displays the next shape on screen.
+        :param batch: list of (surface, position) drawn this frame, the shape's cells are added to it
         """
+        start_x, start_y = self.start
         for (x, y), colour in self.blocks.get_shape_next():
-            x, y = x - 3, y
+            x, y = x - start_x + 1, y - start_y
 
-            pygame.draw.rect(self.screen, colour, (
-                self.display_width + 12 + (25 * x), 35 + (25 * y), 25, 25
-            ))
+            batch.append((self.sprites.cell(colour, (25, 25)), (self.display_width + 12 + (25 * x), 35 + (25 * y))))
 
-            pygame.draw.rect(self.screen, (50,) * 3, (
-                self.display_width + 12 + (25 * x), 35 + (25 * y), 25, 25
-            ), 3)
+    def background(self):
+        """
+        Returns the static layer of the game screen: backgrounds, labels and the grid.
+        It is only drawn again when the window size changes or the grid is toggled.
+        :return: pygame.Surface
+        """
+        key = self.window_width, self.window_height, self.grid_enabled
+        if self._background is not None and self._background_key == key:
+            return self._background
+
+        surface = pygame.Surface((self.window_width, self.window_height)).convert()
+        surface.fill(self.colour_clear)
+
+        # play area background
+        pygame.draw.rect(surface, (22,) * 3, (0, 0, self.display_width, self.display_height))
+
+        # side panel background
+        pygame.draw.rect(surface, (20,) * 3, (
+            self.display_width, 0,
+            self.window_width - self.display_width, self.window_height))
+
+        # next shape panel
+        surface.blit(self.make_text("Next Shape:", 16, font="arial"), (self.display_width + 5, 10))
+
+        # top players panel
+        surface.blit(self.make_text("Top 5:", 20, font="arial"), (self.display_width + 5, 180))
+
+        # controls texts
+        surface.blit(self.make_text("Controls:", font="arial"), (self.display_width + 5, 320))
+        surface.blit(self.make_text("Arrows - move", font="arial"), (self.display_width + 5, 340))
+        surface.blit(self.make_text("Space - drop", font="arial"), (self.display_width + 5, 360))
+        surface.blit(self.make_text("M - music off/on", font="arial"), (self.display_width + 5, 380))
+        surface.blit(self.make_text("R - reset", font="arial"), (self.display_width + 5, 400))
+        surface.blit(self.make_text("P - pause", font="arial"), (self.display_width + 5, 420))
+
+        # the score text
+        pygame.draw.rect(surface, (20,) * 3, (
+            0, self.display_height,
+            self.display_width, self.window_height - self.display_width))
+
+        self.creator = surface.blit(
+            self.make_text("Falling PyBlocks by Eduard Kotkas (GitHub - @edkotkas)",
+                           colour=(255,) * 3
+                           ), (5, self.window_height - 18))
 
-    def grid(self):
+        if self.grid_enabled is True:
+            self.grid(surface)
+
+        self._background = surface
+        self._background_key = key
+
+        # everything on screen sits on top of this layer
+        self.dirty.invalidate()
+
+        return surface
+
+    def grid(self, surface=None):
         """
         Displays the grid on the playable area.
+        :param surface: surface to draw on, the screen by default
         :return:
         """
-        for column in range(self.grid_x):
-            for row in range(self.grid_y):
-                pygame.draw.rect(self.screen, (21,) * 3, (
+        if surface is None:
+            surface = self.screen
+
+        for column in range(self.view_width):
+            for row in range(self.view_height):
+                pygame.draw.rect(surface, (21,) * 3, (
                     self.grid_real_x * column, self.grid_real_y * row,
                     self.grid_real_x, self.grid_real_y), 1)
 
     def pixel(self, x, y):
         """
         Converts grid coordinates to pixel coordinates.
-        :param x: int between 0 and 10
-        :param y: int between 0 and 20
+        :param x: column, between 0 and self.grid_x
+        :param y: row, between 0 and self.grid_y
         :return: converted coordinates
         """
-        return x * (self.display_width / 10), y * (self.display_height / 20)
+        return (x - self.view_x) * self.grid_real_x, (y - self.view_y) * self.grid_real_y
+
+    def cell_rect(self, x, y):
+        """
+        Returns the screen area of a grid cell.
+        :param x: column, between 0 and self.grid_x
+        :param y: row, between 0 and self.grid_y
+        :return: pygame.Rect
+        """
+        return pygame.Rect(self.pixel(x, y), (self.grid_real_x, self.grid_real_y))
+
+    def visible(self, x, y):
+        """
+        Checks if a grid cell is in view.
+        :return: boolean
+        """
+        return (self.view_x <= x < self.view_x + self.view_width and
+                self.view_y <= y < self.view_y + self.view_height)
+
+    def follow(self):
+        """
+        Scrolls the view to keep the current shape away from its edges.
+        :return: boolean, whether the view moved
+        """
+        piece = self.blocks.get_piece()
+        if piece is None:
+            return False
+
+        shape, rotation, x, y = piece
+        width, height = Blocks._bounds[shape][rotation]
+
+        view = self.view_x, self.view_y
+        self.view_x = self._scroll(self.view_x, self.view_width, self.grid_x, x, width)
+        self.view_y = self._scroll(self.view_y, self.view_height, self.grid_y, y, height)
+
+        return view != (self.view_x, self.view_y)
+
+    @staticmethod
+    def _scroll(start, visible, total, position, size):
+        """
+        Moves one side of the view so a span is at least a quarter of the view from its edges.
+        :param start: first visible cell
+        :param visible: number of visible cells
+        :param total: number of cells
+        :param position: first cell of the span
+        :param size: number of cells in the span
+        :return: new first visible cell
+        """
+        margin = visible / 4
+
+        if position - margin < start:
+            start = position - margin
+        elif position + size + margin > start + visible:
+            start = position + size + margin - visible
+
+        return max(0, min(start, total - visible))
 
     def start_screen(self):
         """
@@ -315,7 +870,7 @@ class Game:
         while True:
 
             # fps
-            pygame.time.Clock().tick(self.fps)
+            self.clock.tick(self.fps)
 
             # clear screen
             self.screen.fill(self.colour_clear)
@@ -350,7 +905,7 @@ class Game:
                         return False
 
                     if creator.collidepoint(mouse_pos):
-                        webbrowser.open("https://github.com/edkotkas")
+                        self.open_creator()
 
             self.screen.blit(self.make_text("Falling PyBlocks", 32, (255,) * 3),
                              ((self.window_width / 2) - 150, self.window_height / 8))
@@ -383,6 +938,43 @@ class Game:
         """
         self.over = False
         self.score = 0
+        self.shift.clear()
+        self.soft_drop = False
+        self.hard_drop = False
+        self.rotate = False
+
+        # finish the recording of the old game and start a new one
+        if self.replay is not None:
+            self.replay.close(self.blocks)
+
+        self.seed = random.getrandbits(32)
+        self.engine.reset(self.seed)
+        if self.bot is not None:
+            self.bot.reset()
+        self.autoplayed = self.autoplay
+        self.history.clear()
+        self._history_piece = None
+        self.record()
+
+    def record(self):
+        """
+        Starts recording the current game to the replays directory.
+        :return:
+        """
+        if REPLAYS is None or self.versus is not None:
+            return
+
+        if not os.path.isdir(REPLAYS):
+            os.makedirs(REPLAYS)
+
+        self.replay = Recorder(
+            os.path.join(REPLAYS, "%s-%08x.fpb" % (time.strftime("%Y%m%d-%H%M%S"), self.seed)),
+            self.seed,
+            (self.grid_x, self.grid_y),
+            self.start,
+            self.engine.gravity,
+            self.engine.soft_gravity
+        )
 
     def make_text(self, string, size=14, colour=(200,)*3, font="monospace"):
         """
@@ -393,22 +985,38 @@ class Game:
         :param font: font family
         :return:
         """
-        return pygame.font.SysFont(font, size).render(string, 1, colour)
+        return self.text.render(string, size, colour, font)
 
     def get_player(self):
         """
         Gets the players name to be added to the top 5.
+        Games the autoplayer played any part of aren't added.
         :return:
         """
-        self.top_players.append((self.score, self.player_name))
+        if self.autoplayed is True:
+            return
 
-        if len(self.top_players) > 1:
-            for i in range(len(self.top_players)-1):
-                if self.top_players[i + 1][0] > self.top_players[i][0]:
-                    self.top_players[i + 1], self.top_players[i] = self.top_players[i], self.top_players[i + 1]
+        self.leaderboard.add(self.score, self.player_name, self.seed)
+        self.top_players = self.leaderboard.top()
 
 
 if __name__ == "__main__":
     fpb = Game()
-    fpb.start_screen()
-    fpb.loop()
\ No newline at end of file
+    try:
+        fpb.start_screen()
+
+        # python game.py ADDRESS plays against someone, see Game.play_versus()
+        if len(sys.argv) > 1:
+            fpb.play_versus(sys.argv[1])
+
+        fpb.loop()
+    finally:
+        # write the scores still waiting for a batch, the profiled frames and the captured ones
+        fpb.leaderboard.close()
+        fpb.profiler.close()
+        if fpb.capture is not None:
+            fpb.capture.close()
+
+        # a game quit before it ended still gets its final board, so it can be verified
+        if fpb.replay is not None:
+            fpb.replay.close(fpb.blocks)
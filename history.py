@@ -0,0 +1,57 @@
+from collections import deque
+
+
+class History:
+    def __init__(self, limit=100):
+        """
+        The last few snapshots of a game, the oldest are dropped once the limit is reached.
+        Snapshots taken with the latest one as their base only add the rows that changed,
+        so even a long history stays small.
+        :param limit: most snapshots to keep
+        :return:
+        """
+
+        self._snapshots = deque(maxlen=limit)
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def push(self, snapshot):
+        """
+        Adds the newest snapshot.
+        :param snapshot: Engine or Blocks snapshot
+        :return:
+        """
+
+        self._snapshots.append(snapshot)
+
+    def latest(self):
+        """
+        Returns the newest snapshot, to take the next one against.
+        :return: snapshot, None if there is none
+        """
+
+        if not self._snapshots:
+            return None
+
+        return self._snapshots[-1]
+
+    def undo(self):
+        """
+        Drops the newest snapshot and returns the one before it, which is kept.
+        :return: snapshot, None if there is nothing to go back to
+        """
+
+        if len(self._snapshots) < 2:
+            return None
+
+        self._snapshots.pop()
+        return self._snapshots[-1]
+
+    def clear(self):
+        """
+        Forgets every snapshot.
+        :return:
+        """
+
+        self._snapshots.clear()
@@ -0,0 +1,96 @@
+from engine import Engine
+
+
+class AutoShift:
+    def __init__(self, delay=150, rate=50):
+        """
+        Turns held left and right keys into sideways moves: one straight away,
+        then after the delay one every rate milliseconds (delayed auto shift and auto repeat).
+        Runs on simulation time, so at most one move is made per step.
+        :param delay: milliseconds a key is held before it repeats
+        :param rate: milliseconds between repeated moves
+        :return:
+        """
+
+        self.delay = delay
+        self.rate = rate
+
+        # directions held down, the last one pressed wins
+        self._held = []
+
+        # pressed since the last step, so a quick tap still moves
+        self._tapped = None
+
+        # milliseconds until the next move, and whether the delay is over
+        self._wait = 0
+        self._repeating = False
+
+    def press(self, direction):
+        """
+        Starts shifting in a direction.
+        :param direction: Engine.LEFT or Engine.RIGHT
+        :return:
+        """
+
+        if direction in self._held:
+            self._held.remove(direction)
+        self._held.append(direction)
+
+        self._tapped = direction
+        self._restart()
+
+    def release(self, direction):
+        """
+        Stops shifting in a direction, going back to the other one if it is still held.
+        :param direction: Engine.LEFT or Engine.RIGHT
+        :return:
+        """
+
+        if direction not in self._held:
+            return
+
+        active = self._held[-1] == direction
+        self._held.remove(direction)
+
+        if active:
+            self._restart()
+
+    def clear(self):
+        """
+        Forgets the held directions.
+        :return:
+        """
+
+        self._held = []
+        self._tapped = None
+        self._restart()
+
+    def _restart(self):
+        """
+        Makes the next step move and start the delay again.
+        :return:
+        """
+        self._wait = 0
+        self._repeating = False
+
+    def step(self, elapsed):
+        """
+        Advances the timers by one simulation step.
+        :param elapsed: milliseconds in the step
+        :return: Engine.LEFT or Engine.RIGHT when a move is due, otherwise Engine.NOTHING
+        """
+
+        tapped, self._tapped = self._tapped, None
+
+        if not self._held:
+            return Engine.NOTHING if tapped is None else tapped
+
+        if self._wait > 0:
+            self._wait -= elapsed
+            if self._wait > 0:
+                return Engine.NOTHING
+
+        self._wait += self.rate if self._repeating else self.delay
+        self._repeating = True
+
+        return self._held[-1]
@@ -0,0 +1,111 @@
+import heapq
+import sqlite3
+import time
+
+
+class Leaderboard:
+    def __init__(self, path=':memory:', size=5, batch=8):
+        """
+        High scores kept in a SQLite file, with only the best few held in memory.
+        :param path: database file, ':memory:' to keep nothing on disk
+        :param size: number of top scores to keep in memory
+        :param batch: scores to collect before writing them in one transaction
+        :return:
+        """
+
+        self.size = size
+        self.batch = batch
+
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "id INTEGER PRIMARY KEY, score INTEGER NOT NULL, name TEXT NOT NULL, seed INTEGER, time REAL)"
+        )
+        # lets the top scores be read without going through the whole history
+        self._db.execute("CREATE INDEX IF NOT EXISTS scores_score ON scores (score DESC)")
+        self._db.commit()
+
+        # scores not written yet
+        self._pending = []
+
+        # min-heap of (score, -order, name), the worst of the top scores first;
+        # order counts up, so the earlier of two equal scores ranks higher
+        self._heap = []
+        self._order = 0
+        self._top = None
+
+        for score, name in self._db.execute(
+                "SELECT score, name FROM scores ORDER BY score DESC, id LIMIT ?", (size,)):
+            self._push(score, name)
+
+    def _push(self, score, name):
+        """
+        Offers a score to the in-memory top scores.
+        :return: boolean, whether it made it in
+        """
+
+        entry = score, -self._order, name
+        self._order += 1
+
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, entry)
+        elif entry > self._heap[0]:
+            heapq.heapreplace(self._heap, entry)
+        else:
+            return False
+
+        self._top = None
+        return True
+
+    def add(self, score, name, seed=None):
+        """
+        Records the score of a finished game.
+        :param score: final score
+        :param name: player name
+        :param seed: seed of the game, to find its replay
+        :return: boolean, whether the score made it into the top scores
+        """
+
+        self._pending.append((score, name, seed, time.time()))
+        if len(self._pending) >= self.batch:
+            self.flush()
+
+        return self._push(score, name)
+
+    def top(self):
+        """
+        Returns the top scores, best first.
+        :return: tuple of (score, name)
+        """
+
+        if self._top is None:
+            self._top = tuple((score, name) for score, _, name in sorted(self._heap, reverse=True))
+
+        return self._top
+
+    def flush(self):
+        """
+        Writes the collected scores to the database.
+        :return:
+        """
+
+        if not self._pending:
+            return
+
+        with self._db:
+            self._db.executemany("INSERT INTO scores (score, name, seed, time) VALUES (?, ?, ?, ?)", self._pending)
+
+        self._pending = []
+
+    def close(self):
+        """
+        Writes what is left and closes the database.
+        :return:
+        """
+
+        if self._db is None:
+            return
+
+        self.flush()
+        self._db.close()
+        self._db = None
@@ -0,0 +1,139 @@
+import csv
+import math
+
+from collections import deque
+from timeit import default_timer
+
+
+def percentile(ordered, p):
+    """
+    Returns the nearest rank percentile of sorted values.
+    :param ordered: values sorted from low to high
+    :param p: percentile, from 0 to 100
+    :return: one of the values, None if there are none
+    """
+    if not ordered:
+        return None
+    rank = int(math.ceil(p / 100.0 * len(ordered))) - 1
+    return ordered[min(max(rank, 0), len(ordered) - 1)]
+
+
+class Profiler:
+    def __init__(self, phases, window=300, path=None):
+        """
+        Times the phases of every frame and keeps the last few frames for statistics.
+        :param phases: names of the phases, in the order they happen
+        :param window: number of frames to keep
+        :param path: optional CSV file to stream every frame to
+        :return:
+        """
+
+        self.phases = tuple(phases)
+        self._index = dict((name, i) for i, name in enumerate(self.phases))
+
+        # seconds spent per phase in the current frame
+        self._times = [0.0] * len(self.phases)
+
+        # the last frames, per phase and in total
+        self._history = [deque(maxlen=window) for _ in self.phases]
+        self._frames = deque(maxlen=window)
+
+        self._start = None
+        self._last = default_timer()
+        self._count = 0
+
+        # statistics are only worked out every few frames
+        self._refresh = 10
+        self._summary = None
+
+        # whether the game should draw the numbers
+        self.hud = False
+
+        self._file = None
+        self._csv = None
+        if path is not None:
+            self.record(path)
+
+    def frame(self):
+        """
+        Finishes the current frame and starts timing the next one.
+        :return:
+        """
+
+        now = default_timer()
+
+        if self._start is not None:
+            total = now - self._start
+            self._frames.append(total)
+
+            for history, spent in zip(self._history, self._times):
+                history.append(spent)
+
+            if self._csv is not None:
+                self._csv.writerow([self._count, '%.6f' % total] + ['%.6f' % spent for spent in self._times])
+
+            self._count += 1
+
+        self._times = [0.0] * len(self.phases)
+        self._start = self._last = now
+
+    def mark(self, phase):
+        """
+        Adds the time since the previous mark to a phase.
+        :param phase: name of the phase that just finished
+        :return:
+        """
+
+        now = default_timer()
+        self._times[self._index[phase]] += now - self._last
+        self._last = now
+
+    def summary(self, top=3, ignore=('wait',)):
+        """
+        Returns statistics over the kept frames, worked out again every few frames.
+        :param top: number of phases to list
+        :param ignore: phases left out of the list
+        :return: (fps, p50 ms, p99 ms, [(phase, mean ms), ...]), None before the first frame
+        """
+
+        if not self._frames:
+            return None
+
+        if self._summary is not None and self._count % self._refresh:
+            return self._summary
+
+        frames = sorted(self._frames)
+        mean = sum(frames) / len(frames)
+
+        phases = [(name, sum(history) / len(history) * 1000)
+                  for name, history in zip(self.phases, self._history) if name not in ignore]
+        phases.sort(key=lambda phase: phase[1], reverse=True)
+
+        self._summary = ((1 / mean if mean else 0.0), percentile(frames, 50) * 1000, percentile(frames, 99) * 1000,
+                         phases[:top])
+        return self._summary
+
+    def record(self, path):
+        """
+        Starts streaming every frame to a CSV file.
+        :param path: file to write to
+        :return:
+        """
+
+        self.close()
+
+        self._file = open(path, 'wb')
+        self._csv = csv.writer(self._file)
+        self._csv.writerow(['frame', 'total'] + list(self.phases))
+
+    def close(self):
+        """
+        Stops streaming to the CSV file.
+        :return:
+        """
+
+        if self._file is not None:
+            self._file.close()
+
+        self._file = None
+        self._csv = None
@@ -0,0 +1,159 @@
+import sys
+import time
+
+from blocks import Blocks
+from engine import Engine
+
+# file layout:
+#   MAGIC, then varints: seed, grid_x, grid_y, start_x, start_y, gravity, soft_gravity
+#   records of varint steps since the previous record and one action byte
+#   an END record followed by the 20 byte digest of the final board
+MAGIC = 'FPB1'
+END = 0xff
+
+
+def write_varint(stream, value):
+    """
+    Writes a non-negative int, 7 bits per byte.
+    :param stream: file to write to
+    :param value: int
+    :return:
+    """
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    stream.write(out)
+
+
+def read_varint(stream):
+    """
+    Reads an int written by write_varint.
+    :param stream: file to read from
+    :return: int, None at the end of the file
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = stream.read(1)
+        if not byte:
+            return None
+
+        byte = ord(byte)
+        value |= (byte & 0x7f) << shift
+        shift += 7
+
+        if not byte & 0x80:
+            return value
+
+
+class Recorder:
+    def __init__(self, path, seed, grid=(10, 20), start=(4, 0), gravity=20, soft_gravity=2):
+        """
+        Writes the actions of a game to disk as they happen.
+        Only steps with an action are written, so the file grows with the input, not the game length.
+        :param path: file to write to
+        :param seed: seed the game's Blocks were made with
+        :param grid: (columns, rows) of the play field
+        :param start: position new shapes appear at
+        :param gravity: engine gravity
+        :param soft_gravity: engine gravity while DOWN is held
+        :return:
+        """
+
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        for value in (seed, grid[0], grid[1], start[0], start[1], gravity, soft_gravity):
+            write_varint(self._file, value)
+
+        self._step = 0
+        self._last = 0
+
+    def step(self, action):
+        """
+        Records the action of one engine step.
+        :param action: Engine action flags
+        :return:
+        """
+
+        self._step += 1
+
+        if action:
+            write_varint(self._file, self._step - self._last)
+            self._file.write(chr(action))
+            self._last = self._step
+
+    def close(self, blocks):
+        """
+        Finishes the recording with the hash of the final board.
+        :param blocks: the Blocks the game was played on
+        :return:
+        """
+
+        if self._file.closed:
+            return
+
+        write_varint(self._file, self._step - self._last)
+        self._file.write(chr(END))
+        self._file.write(blocks.digest())
+        self._file.close()
+
+    def abandon(self):
+        """
+        Stops recording without finishing, for games the actions no longer describe.
+        play() reports these as never finished.
+        :return:
+        """
+
+        self._file.close()
+
+
+def play(path):
+    """
+    Re-simulates a recorded game as fast as possible.
+    :param path: file written by a Recorder
+    :return: the engine after the last step, and whether the final board matches
+             the recording (None if the recording was never finished)
+    """
+
+    with open(path, 'rb') as stream:
+        if stream.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a replay" % path)
+
+        seed, grid_x, grid_y, start_x, start_y, gravity, soft_gravity = [read_varint(stream) for _ in range(7)]
+
+        engine = Engine(
+            Blocks((grid_x, grid_y), (grid_x, grid_y), (start_x, start_y), seed),
+            gravity,
+            soft_gravity
+        )
+
+        while True:
+            steps = read_varint(stream)
+            action = stream.read(1)
+            if steps is None or not action:
+                return engine, None
+
+            action = ord(action)
+
+            if action == END:
+                for _ in range(steps):
+                    engine.step()
+
+                return engine, stream.read(20) == engine.blocks.digest()
+
+            for _ in range(steps - 1):
+                engine.step()
+            engine.step(action)
+
+
+if __name__ == "__main__":
+    for replay in sys.argv[1:]:
+        start_time = time.time()
+        result, matches = play(replay)
+
+        print("%s: score %d, %d pieces, %d steps in %.3fs, board %s" % (
+            replay, result.score, result.pieces, result.steps, time.time() - start_time,
+            {True: "matches", False: "DIFFERS", None: "not recorded"}[matches]
+        ))
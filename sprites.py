@@ -0,0 +1,133 @@
+import itertools
+
+import pygame
+
+# pixels of an outline sprite or a chunk surface that are left transparent
+KEY = (255, 0, 255)
+
+
+def unkeyed(colour):
+    """
+    Moves a colour off the transparent key, anything drawn in the key colour would disappear.
+    :param colour: RGB
+    :return: RGB, the colour itself unless it is the key
+    """
+
+    return (254, 0, 255) if colour == KEY else colour
+
+
+def blits(surface, sequence):
+    """
+    Draws many surfaces in one call, one by one on pygame versions without Surface.blits.
+    :param surface: surface to draw on
+    :param sequence: (source, position) or (source, position, area) tuples
+    :return:
+    """
+
+    if hasattr(surface, 'blits'):
+        surface.blits(sequence, 0)
+    else:
+        for item in sequence:
+            surface.blit(*item)
+
+
+class SpriteCache:
+    def __init__(self, limit=256, border=(50,) * 3, width=3):
+        """
+        Keeps the most recently used block cells pre-rendered, one surface per colour and size,
+        so a cell is drawn with one blit instead of a fill and a border.
+        :param limit: max number of sprites to keep
+        :param border: colour of the cell borders
+        :param width: width of the cell borders in pixels
+        :return:
+        """
+
+        self._limit = limit
+        self._border = border
+        self._width = width
+
+        # (kind, size, colour) -> pygame.Surface, and when it was last used; plain dicts
+        # rather than an OrderedDict, this is looked up for every cell drawn
+        self._sprites = {}
+        self._used = {}
+        self._clock = itertools.count()
+
+        self.hits = 0
+        self.misses = 0
+
+    def cell(self, colour, size):
+        """
+        Returns a filled cell with a border.
+        :param colour: RGB of the cell
+        :param size: (width, height) in pixels
+        :return: pygame.Surface
+        """
+
+        return self._get('cell', size, colour)
+
+    def outline(self, colour, size):
+        """
+        Returns the one pixel outline of a cell, transparent inside.
+        :param colour: RGB of the outline
+        :param size: (width, height) in pixels
+        :return: pygame.Surface
+        """
+
+        return self._get('outline', size, unkeyed(colour))
+
+    def _get(self, kind, size, colour):
+        """
+        Returns a sprite, rendering it only if it isn't cached.
+        :return: pygame.Surface
+        """
+
+        key = kind, size, colour
+        sprite = self._sprites.get(key)
+
+        if sprite is None:
+            self.misses += 1
+            sprite = self._render(kind, size, colour)
+
+            # forget the least recently used sprite, only searched for on a miss
+            if len(self._sprites) >= self._limit:
+                oldest = min(self._used, key=self._used.get)
+                del self._sprites[oldest]
+                del self._used[oldest]
+
+            self._sprites[key] = sprite
+        else:
+            self.hits += 1
+
+        self._used[key] = next(self._clock)
+
+        return sprite
+
+    def _render(self, kind, size, colour):
+        """
+        Draws a sprite, in the display's pixel format so blitting it doesn't convert it.
+        :return: pygame.Surface
+        """
+
+        sprite = pygame.Surface(size).convert()
+        rect = (0, 0) + tuple(size)
+
+        if kind == 'cell':
+            sprite.fill(colour)
+            pygame.draw.rect(sprite, self._border, rect, self._width)
+        else:
+            sprite.fill(KEY)
+            sprite.set_colorkey(KEY)
+            pygame.draw.rect(sprite, colour, rect, 1)
+
+        return sprite
+
+    def clear(self):
+        """
+        Forgets all sprites.
+        :return:
+        """
+
+        self._sprites = {}
+        self._used = {}
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,79 @@
+import pygame
+
+from collections import OrderedDict
+
+
+class TextCache:
+    def __init__(self, limit=64):
+        """
+        Keeps loaded fonts and the most recently rendered text surfaces.
+        :param limit: max number of rendered surfaces to keep
+        :return:
+        """
+
+        self._limit = limit
+
+        # (family, size) -> pygame.font.Font
+        self._fonts = {}
+
+        # (string, size, colour, family) -> pygame.Surface, oldest first
+        self._surfaces = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def font(self, family, size):
+        """
+        Returns the font, loading it only on first use.
+        :param family: font family
+        :param size: font size
+        :return: pygame.font.Font
+        """
+
+        key = family, size
+        font = self._fonts.get(key)
+
+        if font is None:
+            font = pygame.font.SysFont(family, size)
+            self._fonts[key] = font
+
+        return font
+
+    def render(self, string, size, colour, family):
+        """
+        Returns the rendered text, rendering it only if it isn't cached.
+        :param string: text to be shown
+        :param size: font size
+        :param colour: font colour
+        :param family: font family
+        :return: pygame.Surface
+        """
+
+        key = string, size, colour, family
+        surface = self._surfaces.pop(key, None)
+
+        if surface is None:
+            self.misses += 1
+            surface = self.font(family, size).render(string, 1, colour)
+
+            # forget the least recently used text
+            if len(self._surfaces) >= self._limit:
+                self._surfaces.popitem(last=False)
+        else:
+            self.hits += 1
+
+        # (re)insert as the most recently used
+        self._surfaces[key] = surface
+
+        return surface
+
+    def clear(self):
+        """
+        Forgets all fonts and surfaces.
+        :return:
+        """
+
+        self._fonts = {}
+        self._surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
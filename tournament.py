@@ -0,0 +1,285 @@
+import argparse
+import gzip
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import zlib
+
+from blocks import Blocks
+from bot import Bot, WEIGHTS
+from engine import Engine
+
+GRID = 10, 20
+START = 4, 0
+
+# seconds between flushing the results file, what wasn't flushed runs again on resume
+FLUSH_TIME = 1.0
+
+# seconds to wait for a result at a time, without a timeout Ctrl-C isn't noticed while waiting
+WAIT = 3600
+
+
+def configs(grid):
+    """
+    Expands a parameter grid into every combination of its values.
+    :param grid: dict of parameter name to list of values, the weight names of the
+                 bot and 'depth'; parameters left out keep their defaults
+    :return: list of dicts
+    """
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*[grid[name] for name in names])]
+
+
+def settings(config):
+    """
+    Turns a config into the bot's settings.
+    :param config: dict of parameter name to value
+    :return: (weights, depth)
+    """
+    weights = dict(WEIGHTS)
+    depth = 1
+
+    for name, value in config.items():
+        if name == 'depth':
+            depth = value
+        elif name in weights:
+            weights[name] = value
+        else:
+            raise ValueError("unknown parameter %s" % name)
+
+    return weights, depth
+
+
+def key(config, seed, limit):
+    """
+    Returns what identifies a job in the results.
+    :param limit: most shapes the game was allowed
+    :return: (config as sorted JSON, seed, limit)
+    """
+    return json.dumps(config, sort_keys=True), seed, limit
+
+
+def play((config, seed, pieces)):
+    """
+    Plays one seeded game headless with the bot, at the engine's default gravity,
+    the one the game falls at. Module level so it can run in a worker process.
+    :param config: dict of parameter name to value
+    :param seed: seed of the shapes
+    :param pieces: most shapes to place before stopping the game
+    :return: result dict with the config, seed, shape limit, score, lines, pieces and seconds taken
+    """
+    weights, depth = settings(config)
+    start_time = time.time()
+
+    engine = Engine(Blocks(GRID, GRID, START, seed))
+    bot = Bot(weights, depth)
+
+    while not engine.is_over and engine.pieces < pieces:
+        bot.play(engine)
+
+    return {
+        'config': config,
+        'seed': seed,
+        'limit': pieces,
+        'score': engine.score,
+        'lines': engine.lines,
+        'pieces': engine.pieces,
+        'time': time.time() - start_time,
+    }
+
+
+def play_chunk(jobs):
+    """
+    Plays several games, so a worker gets them in one message.
+    :param jobs: play() arguments
+    :return: list of result dicts
+    """
+    return [play(job) for job in jobs]
+
+
+def read(path):
+    """
+    Reads the results written so far, up to where the file was cut off if it was.
+    :param path: gzip file of JSON lines
+    :return: list of result dicts
+    """
+    if not os.path.exists(path):
+        return []
+
+    with open(path, 'rb') as stream:
+        data = stream.read()
+
+    # one gzip member per run, the last one can end anywhere
+    text = []
+    while data:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            text.append(decompressor.decompress(data))
+        except zlib.error:
+            break
+        data = decompressor.unused_data
+
+    results = []
+    for line in ''.join(text).splitlines():
+        try:
+            results.append(json.loads(line))
+        except ValueError:
+            # the line being written when the run stopped
+            break
+
+    return results
+
+
+def rewrite(path, results):
+    """
+    Replaces the results file with just the complete results, so it can be appended to.
+    :param path: gzip file of JSON lines
+    :param results: result dicts
+    :return:
+    """
+    temporary = path + '.tmp'
+
+    with gzip.open(temporary, 'wb') as stream:
+        for result in results:
+            stream.write(json.dumps(result, sort_keys=True) + '\n')
+
+    os.rename(temporary, path)
+
+
+def _ignore_interrupt():
+    # workers leave Ctrl-C to the parent, which stops the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run(grid, seeds, path, processes=None, pieces=500, report=None):
+    """
+    Plays every config of the grid on every seed, spread over a process pool.
+    Results are appended to the file as they come in; jobs already in it with the same
+    shape limit are skipped, so an interrupted run picks up where it stopped.
+    :param grid: parameter grid, see configs()
+    :param seeds: seeds to play every config on
+    :param path: gzip file of JSON lines to write the results to
+    :param processes: worker processes, one per core by default
+    :param pieces: most shapes to place per game
+    :param report: optional function called with (done, total, result) after every result
+    :return: every result for the grid, from this run and earlier ones
+    """
+    jobs = [(config, seed) for config in configs(grid) for seed in seeds]
+    for config, _ in jobs:
+        settings(config)
+
+    # keep what an earlier run finished
+    results = read(path)
+    rewrite(path, results)
+
+    # results from before the limit was kept have none, and are played again
+    finished = set(key(result['config'], result['seed'], result.get('limit')) for result in results)
+    todo = [(config, seed, pieces) for config, seed in jobs if key(config, seed, pieces) not in finished]
+
+    wanted = set(key(config, seed, pieces) for config, seed in jobs)
+    results = [result for result in results
+               if key(result['config'], result['seed'], result.get('limit')) in wanted]
+
+    if not todo:
+        return results
+
+    processes = processes or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes, _ignore_interrupt)
+
+    # enough chunks to keep every worker busy to the end, few enough to keep the overhead down;
+    # chunked here, as imap_unordered only takes a timeout without its own chunks
+    size = max(1, len(todo) // (processes * 16))
+    chunks = [todo[i:i + size] for i in range(0, len(todo), size)]
+
+    stream = gzip.open(path, 'ab')
+    flushed = time.time()
+    done = 0
+
+    try:
+        played = pool.imap_unordered(play_chunk, chunks)
+
+        for _ in chunks:
+            for result in played.next(WAIT):
+                results.append(result)
+                stream.write(json.dumps(result, sort_keys=True) + '\n')
+
+                done += 1
+                if report is not None:
+                    report(done, len(todo), result)
+
+            if time.time() - flushed >= FLUSH_TIME:
+                stream.flush()
+                flushed = time.time()
+
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        stream.close()
+        pool.join()
+
+    return results
+
+
+def summary(results):
+    """
+    Averages the results of every config.
+    :param results: result dicts
+    :return: list of (config, games, mean lines, mean pieces), most lines first
+    """
+    totals = {}
+    for result in results:
+        config = json.dumps(result['config'], sort_keys=True)
+        games, lines, pieces = totals.get(config, (0, 0, 0))
+        totals[config] = games + 1, lines + result['lines'], pieces + result['pieces']
+
+    rows = [(json.loads(config), games, float(lines) / games, float(pieces) / games)
+            for config, (games, lines, pieces) in totals.items()]
+
+    return sorted(rows, key=lambda row: -row[2])
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Plays the bot over a grid of parameters and seeds.")
+    parser.add_argument('results', help="gzip JSON lines file to write to, and to resume from")
+    parser.add_argument('--grid', default='{}',
+                        help="JSON object, or a file of one, of parameter name to list of values")
+    parser.add_argument('--seeds', type=int, default=100, help="games per config, seeds 0 to SEEDS - 1")
+    parser.add_argument('--processes', type=int, help="worker processes, one per core by default")
+    parser.add_argument('--pieces', type=int, default=500, help="most shapes to place per game")
+    parser.add_argument('--top', type=int, default=10, help="configs to list at the end")
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.grid):
+        with open(args.grid) as stream:
+            grid = json.load(stream)
+    else:
+        grid = json.loads(args.grid)
+
+    start_time = time.time()
+    counts = {'pieces': 0}
+
+    def report(done, total, result):
+        counts['pieces'] += result['pieces']
+        if done % 50 == 0 or done == total:
+            seconds = time.time() - start_time
+            print("%d/%d games, %.1f games/s, %.0f pieces/s" % (
+                done, total, done / seconds, counts['pieces'] / seconds))
+
+    results = run(grid, range(args.seeds), args.results, args.processes, args.pieces, report)
+
+    for config, games, lines, pieces in summary(results)[:args.top]:
+        print("%8.1f lines %8.1f pieces %4d games  %s" % (lines, pieces, games, json.dumps(config, sort_keys=True)))
+
+
+if __name__ == "__main__":
+    try:
+        main(sys.argv[1:])
+    except KeyboardInterrupt:
+        print("stopped, run again to resume")
+        sys.exit(1)
@@ -0,0 +1,412 @@
+import errno
+import io
+import random
+import socket
+import struct
+import sys
+import time
+
+from collections import deque
+
+from blocks import Blocks
+from bot import Bot
+from engine import Engine
+from profiler import percentile
+from replay import read_varint, write_varint
+
+# message types, every message is a type byte and a 32-bit body length before the body;
+# a sync of every row of a big board doesn't fit in 16 bits
+INPUT = 1
+ACK = 2
+ROWS = 3
+GARBAGE = 4
+OVER = 5
+HELLO = 6
+
+HEADER = struct.Struct('!BI')
+
+# sequence number, action flags, send time
+INPUT_BODY = struct.Struct('!IBd')
+
+# sequence number and send time of the acknowledged input
+ACK_BODY = struct.Struct('!Id')
+
+# number of rows, column of the hole
+GARBAGE_BODY = struct.Struct('!BH')
+
+# columns and rows of the play field, both sides must play on the same size
+HELLO_BODY = struct.Struct('!HH')
+
+# rows sent to the opponent for the lines cleared at once
+GARBAGE_LINES = {2: 1, 3: 2, 4: 4}
+
+# errors of a non-blocking socket that only mean it isn't ready
+WOULD_BLOCK = errno.EAGAIN, errno.EWOULDBLOCK
+
+
+def connect(address, timeout=60):
+    """
+    Opens the connection to the other player, waiting until there is one.
+    :param address: 'host:port' to join a game, ':port' to wait for someone to join
+    :param timeout: seconds to wait
+    :return: connected non-blocking socket
+    """
+    host, _, port = address.rpartition(':')
+
+    if host:
+        sock = socket.create_connection((host, int(port)), timeout)
+    else:
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(('', int(port)))
+        server.listen(1)
+        server.settimeout(timeout)
+
+        sock, _ = server.accept()
+        server.close()
+
+    # inputs are tiny, send them straight away
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setblocking(False)
+
+    return sock
+
+
+def pair():
+    """
+    Returns two sockets connected to each other over localhost.
+    :return: (socket, socket)
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+
+    first = socket.create_connection(server.getsockname())
+    second, _ = server.accept()
+    server.close()
+
+    for sock in (first, second):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setblocking(False)
+
+    return first, second
+
+
+class Versus:
+    def __init__(self, sock, blocks, sync_time=0.1):
+        """
+        One side of a head-to-head game. Sends the inputs, the cleared lines as garbage
+        and the changed rows of the play field, and takes in the same from the opponent.
+        Never blocks, poll() does all the network work and is meant to be called every frame.
+        The first message either way is the size of the play field; the connection is closed
+        if the sizes differ, or if the opponent sends anything that doesn't fit the play field.
+        :param sock: connected non-blocking socket
+        :param blocks: the Blocks played on this side
+        :param sync_time: seconds between sending the changed rows
+        :return:
+        """
+
+        self._sock = sock
+        self._blocks = blocks
+        self.sync_time = sync_time
+
+        self._out = bytearray()
+        self._in = bytearray()
+        self.closed = False
+
+        # the opponent's play field as row bitmasks, top row first
+        width, height = blocks.get_board().size()
+        self.opponent_rows = [0] * height
+        self.opponent_over = False
+        self.opponent_inputs = 0
+
+        # rows as the opponent last got them
+        self._sent_rows = (0,) * height
+        self._synced = 0
+
+        self._sequence = 0
+        self._holes = random.Random()
+        self._width = width
+
+        # traffic and the round trip time of the last inputs
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._start = time.time()
+        self._latencies = deque(maxlen=200)
+
+        # nothing else from the opponent is taken before its size is
+        self._greeted = False
+        self._send(HELLO, HELLO_BODY.pack(width, height))
+
+    def input(self, action):
+        """
+        Tells the opponent about an engine step with an action.
+        :param action: Engine action flags
+        :return:
+        """
+
+        if action:
+            self._sequence += 1
+            self._send(INPUT, INPUT_BODY.pack(self._sequence, action, time.time()))
+
+    def cleared(self, lines):
+        """
+        Sends garbage rows for lines cleared in one step.
+        :param lines: number of lines
+        :return:
+        """
+
+        rows = GARBAGE_LINES.get(lines, 0)
+        if rows:
+            self._send(GARBAGE, GARBAGE_BODY.pack(rows, self._holes.randrange(self._width)))
+
+    def over(self):
+        """
+        Tells the opponent this side is out.
+        :return:
+        """
+
+        self._sync()
+        self._send(OVER, '')
+
+    def poll(self):
+        """
+        Sends what is waiting and handles what has arrived, without blocking.
+        :return:
+        """
+
+        if self.closed:
+            return
+
+        if time.time() - self._synced >= self.sync_time:
+            self._sync()
+
+        while True:
+            try:
+                data = self._sock.recv(65536)
+            except socket.error as error:
+                if error.errno not in WOULD_BLOCK:
+                    self.close()
+                break
+
+            if not data:
+                self.close()
+                break
+
+            self._in += data
+            self.bytes_received += len(data)
+
+        while not self.closed and len(self._in) >= HEADER.size:
+            kind, length = HEADER.unpack_from(self._in)
+            end = HEADER.size + length
+            if len(self._in) < end:
+                break
+
+            body = bytes(self._in[HEADER.size:end])
+            del self._in[:end]
+
+            # a body cut short or too long is as bad as one out of bounds
+            try:
+                self._handle(kind, body)
+            except struct.error:
+                self.close()
+
+        # last, so the replies to what just arrived go out straight away
+        if self._out and not self.closed:
+            try:
+                sent = self._sock.send(self._out)
+                del self._out[:sent]
+                self.bytes_sent += sent
+            except socket.error as error:
+                if error.errno not in WOULD_BLOCK:
+                    self.close()
+
+    def stats(self):
+        """
+        Returns the traffic since connecting and the input round trip times.
+        :return: (bytes sent per second, bytes received per second,
+                  p50 ms, p99 ms), the times are None before the first acknowledgement
+        """
+
+        elapsed = max(time.time() - self._start, 1e-6)
+        latencies = [latency * 1000 for latency in sorted(self._latencies)]
+
+        return (self.bytes_sent / elapsed, self.bytes_received / elapsed,
+                percentile(latencies, 50), percentile(latencies, 99))
+
+    def close(self):
+        """
+        Closes the connection.
+        :return:
+        """
+
+        if not self.closed:
+            self.closed = True
+            self._sock.close()
+
+    def _send(self, kind, body):
+        """
+        Queues a message, poll() sends it.
+        :param kind: message type
+        :param body: packed message
+        :return:
+        """
+
+        self._out += HEADER.pack(kind, len(body))
+        self._out += body
+
+    def _sync(self):
+        """
+        Queues the rows that changed since they were last sent.
+        :return:
+        """
+
+        self._synced = time.time()
+
+        rows = self._blocks.get_board().rows()
+        changed = [(y, row) for y, (row, sent) in enumerate(zip(rows, self._sent_rows)) if row != sent]
+        if not changed:
+            return
+
+        body = io.BytesIO()
+        write_varint(body, len(changed))
+        for y, row in changed:
+            write_varint(body, y)
+            write_varint(body, row)
+
+        self._send(ROWS, body.getvalue())
+        self._sent_rows = rows
+
+    def _handle(self, kind, body):
+        """
+        Reacts to a message from the opponent, closing the connection on one that doesn't fit.
+        :param kind: message type
+        :param body: packed message
+        :return:
+        """
+
+        height = len(self.opponent_rows)
+
+        if not self._greeted:
+            if kind != HELLO or HELLO_BODY.unpack(body) != (self._width, height):
+                self.close()
+            self._greeted = True
+
+        elif kind == INPUT:
+            sequence, _, sent = INPUT_BODY.unpack(body)
+            self.opponent_inputs += 1
+            self._send(ACK, ACK_BODY.pack(sequence, sent))
+
+        elif kind == ACK:
+            _, sent = ACK_BODY.unpack(body)
+            self._latencies.append(time.time() - sent)
+
+        elif kind == ROWS:
+            stream = io.BytesIO(body)
+            count = read_varint(stream)
+            if count is None:
+                self.close()
+                return
+
+            for _ in range(count):
+                y = read_varint(stream)
+                row = read_varint(stream)
+                if row is None or not 0 <= y < height or row >> self._width:
+                    self.close()
+                    return
+
+                self.opponent_rows[y] = row
+
+        elif kind == GARBAGE:
+            rows, hole = GARBAGE_BODY.unpack(body)
+            if hole >= self._width:
+                self.close()
+                return
+
+            self._blocks.garbage(rows, hole)
+
+        elif kind == OVER:
+            self.opponent_over = True
+
+
+class StandIn:
+    def __init__(self, sock, seed=None, pace=8):
+        """
+        Headless opponent played by the bot in real time.
+        :param sock: connected non-blocking socket
+        :param seed: seed of its shapes
+        :param pace: engine steps between the bot's actions, higher is slower
+        :return:
+        """
+
+        self.engine = Engine(Blocks((10, 20), (10, 20), (4, 0), seed), 20, 2)
+        self.versus = Versus(sock, self.engine.blocks)
+        self.bot = Bot()
+        self.pace = pace
+        self.done = False
+
+    def step(self):
+        """
+        Advances its game by one engine step.
+        :return:
+        """
+
+        if self.done:
+            return
+
+        if self.engine.is_over:
+            self.versus.over()
+            self.done = True
+            return
+
+        action = Engine.NOTHING
+        if self.engine.steps % self.pace == 0:
+            action = self.bot.action(self.engine.blocks)
+
+        lines = self.engine.step(action)
+        self.versus.input(action)
+        self.versus.cleared(lines)
+
+
+def run(players, seconds, step_time=0.025):
+    """
+    Plays stand-ins in real time and reports the traffic every few seconds.
+    :param players: StandIn instances
+    :param seconds: how long to play for
+    :param step_time: seconds per engine step
+    :return:
+    """
+    start = time.time()
+    report = start
+    steps = 0
+
+    while time.time() - start < seconds and not all(player.versus.closed for player in players):
+        for player in players:
+            player.step()
+            player.versus.poll()
+
+        steps += 1
+        delay = start + steps * step_time - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+        if time.time() - report >= 5 or time.time() - start >= seconds:
+            report = time.time()
+            for i, player in enumerate(players):
+                sent, received, p50, p99 = player.versus.stats()
+                print("player %d: %d lines, %d pieces, sent %.0f B/s, received %.0f B/s, "
+                      "input round trip p50 %s ms, p99 %s ms" % (
+                          i, player.engine.lines, player.engine.pieces, sent, received,
+                          "-" if p50 is None else "%.2f" % p50, "-" if p99 is None else "%.2f" % p99))
+
+
+if __name__ == "__main__":
+    # python versus.py ADDRESS [SECONDS] plays a stand-in against a game at ADDRESS,
+    # python versus.py plays two stand-ins against each other over localhost
+    if len(sys.argv) > 1 and ':' in sys.argv[1]:
+        seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 600
+        run([StandIn(connect(sys.argv[1]))], seconds)
+    else:
+        seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 20
+        first, second = pair()
+        run([StandIn(first, 1, 4), StandIn(second, 2, 4)], seconds)